@@ -1,230 +1,201 @@
 import streamlit as st
-import os
-from pathlib import Path
-import shutil
+import tarfile
+import zipfile
+from datetime import datetime
 
-from utils import load_settings, save_settings, get_file_path, create_directory_if_not_exists
+from utils import load_settings, update_settings, rerun_fragment, get_file_path, get_course_path, get_node_path, create_directory_if_not_exists, filter_nodes, find_clashing_sibling, format_count, format_size, node_stats, select_node
+from hierarchy import new_node_id
+from catalog import RESOURCE_TYPES, count_courses, empty_course_keys, largest_courses, list_resources, remove_resource
+from analytics import VIEW, daily_totals, top_resources
+from bytecache import byte_cache_usage
+from cleanup import delete_later, finish_deletions, pending_deletion_count
+from jobs import pending_job_count
+from metrics import counter_values, histogram_summaries, recent_runs
+from thumbnails import remove_thumbnail
+from storage import get_storage, storage_key
+from bulk_import import ImportItem, ImportResult, import_items, read_archive, uploaded_file_item
 
+# Each admin tab is a fragment: its widgets rerun only that tab. Edits to the
+# hierarchy still rerun the whole app because every tab's selectors depend on it,
+# while file uploads and deletions only rerun the upload tab.
+
+@st.fragment
 def manage_universities():
     """Admin interface for managing universities"""
     st.subheader("Manage Universities")
     
-    settings = st.session_state.settings
-    universities = settings.get("universities", [])
+    hierarchy = load_settings()
     
     # Display existing universities
     st.write("Current Universities:")
-    for i, uni in enumerate(universities):
+    for i, uni in enumerate(filter_nodes(hierarchy, None, "manage_uni")):
         col1, col2 = st.columns([4, 1])
         with col1:
-            st.write(f"{i+1}. {uni}")
+            st.write(f"{i+1}. {uni.name} ({len(uni.semesters)} semesters, {uni.course_count()} courses)")
         with col2:
-            if st.button("Remove", key=f"remove_uni_{i}"):
-                # Check if university has semesters before removing
-                if uni in settings.get("semesters", {}):
-                    for semester in settings["semesters"][uni]:
-                        key = f"{uni}_{semester}"
-                        if key in settings.get("courses", {}):
-                            settings["courses"].pop(key, None)
-                    settings["semesters"].pop(uni, None)
-                universities.remove(uni)
-                save_settings(settings)
+            if st.button("Remove", key=f"remove_uni_{uni.id}"):
+                # Semesters and courses of the university are removed with it; their files are reclaimed in the background
+                if update_settings({"op": "remove", "id": uni.id}):
+                    delete_later(get_node_path(uni))
                 st.rerun()
     
     # Add new university
     st.write("Add New University:")
     new_uni = st.text_input("University Name", key="new_uni_input")
     if st.button("Add University"):
-        if new_uni and new_uni not in universities:
-            universities.append(new_uni)
-            settings["universities"] = universities
-            if "semesters" not in settings:
-                settings["semesters"] = {}
-            settings["semesters"][new_uni] = []
-            save_settings(settings)
+        clash = find_clashing_sibling(hierarchy, None, new_uni) if new_uni else None
+        if new_uni and clash is None:
+            finish_deletions(get_file_path(new_uni))
+            update_settings({"op": "add_university", "id": new_node_id(), "name": new_uni})
             st.success(f"Added {new_uni} to universities!")
             st.rerun()
-        elif new_uni in universities:
+        elif new_uni and clash.name == new_uni:
             st.error(f"{new_uni} already exists!")
+        elif new_uni:
+            st.error(f"{new_uni} would share its upload folder with {clash.name}; choose another name!")
         else:
             st.error("Please enter a university name!")
 
+@st.fragment
 def manage_semesters():
     """Admin interface for managing semesters for each university"""
     st.subheader("Manage Semesters")
     
-    settings = st.session_state.settings
-    universities = settings.get("universities", [])
+    hierarchy = load_settings()
     
-    if not universities:
+    if not hierarchy.universities:
         st.warning("No universities available. Please add a university first.")
         return
     
     # Select university
-    selected_uni = st.selectbox("Select University", universities, key="semester_uni_select")
+    selected_uni = select_node("Select University", hierarchy, None, key="semester_uni_select")
     
     if selected_uni:
-        if "semesters" not in settings:
-            settings["semesters"] = {}
-        if selected_uni not in settings["semesters"]:
-            settings["semesters"][selected_uni] = []
-        
-        semesters = settings["semesters"][selected_uni]
-        
         # Display existing semesters
-        st.write(f"Current Semesters for {selected_uni}:")
-        for i, semester in enumerate(semesters):
+        st.write(f"Current Semesters for {selected_uni.name}:")
+        for i, semester in enumerate(filter_nodes(hierarchy, selected_uni, "manage_sem")):
             col1, col2 = st.columns([4, 1])
             with col1:
-                st.write(f"{i+1}. {semester}")
+                st.write(f"{i+1}. {semester.name} ({semester.course_count()} courses)")
             with col2:
-                if st.button("Remove", key=f"remove_sem_{i}"):
-                    # Check if courses exist for this semester before removing
-                    key = f"{selected_uni}_{semester}"
-                    if key in settings.get("courses", {}):
-                        settings["courses"].pop(key, None)
-                    semesters.remove(semester)
-                    save_settings(settings)
+                if st.button("Remove", key=f"remove_sem_{semester.id}"):
+                    # Courses of the semester are removed with it; their files are reclaimed in the background
+                    if update_settings({"op": "remove", "id": semester.id}):
+                        delete_later(get_node_path(semester))
                     st.rerun()
         
         # Add new semester
-        st.write(f"Add New Semester for {selected_uni}:")
+        st.write(f"Add New Semester for {selected_uni.name}:")
         new_semester = st.text_input("Semester Name", key="new_semester_input")
         if st.button("Add Semester"):
-            if new_semester and new_semester not in semesters:
-                semesters.append(new_semester)
-                settings["semesters"][selected_uni] = semesters
-                save_settings(settings)
-                st.success(f"Added {new_semester} to {selected_uni} semesters!")
+            clash = find_clashing_sibling(hierarchy, selected_uni, new_semester) if new_semester else None
+            if new_semester and clash is None:
+                finish_deletions(get_file_path(selected_uni.name, new_semester))
+                update_settings({"op": "add_semester", "id": new_node_id(), "parent_id": selected_uni.id,
+                                 "name": new_semester})
+                st.success(f"Added {new_semester} to {selected_uni.name} semesters!")
                 st.rerun()
-            elif new_semester in semesters:
-                st.error(f"{new_semester} already exists for {selected_uni}!")
+            elif new_semester and clash.name == new_semester:
+                st.error(f"{new_semester} already exists for {selected_uni.name}!")
+            elif new_semester:
+                st.error(f"{new_semester} would share its upload folder with {clash.name}; choose another name!")
             else:
                 st.error("Please enter a semester name!")
 
+@st.fragment
 def manage_courses():
     """Admin interface for managing courses for each university and semester"""
     st.subheader("Manage Courses")
     
-    settings = st.session_state.settings
-    universities = settings.get("universities", [])
+    hierarchy = load_settings()
     
-    if not universities:
+    if not hierarchy.universities:
         st.warning("No universities available. Please add a university first.")
         return
     
     # Select university
-    selected_uni = st.selectbox("Select University", universities, key="course_uni_select")
+    selected_uni = select_node("Select University", hierarchy, None, key="course_uni_select")
     
     if selected_uni:
-        if "semesters" not in settings:
-            settings["semesters"] = {}
-        if selected_uni not in settings["semesters"]:
-            settings["semesters"][selected_uni] = []
-        
-        semesters = settings["semesters"][selected_uni]
-        
-        if not semesters:
-            st.warning(f"No semesters available for {selected_uni}. Please add a semester first.")
+        if not selected_uni.semesters:
+            st.warning(f"No semesters available for {selected_uni.name}. Please add a semester first.")
             return
         
         # Select semester
-        selected_semester = st.selectbox("Select Semester", semesters, key="course_sem_select")
+        selected_semester = select_node("Select Semester", hierarchy, selected_uni, key="course_sem_select")
         
         if selected_semester:
-            key = f"{selected_uni}_{selected_semester}"
-            if "courses" not in settings:
-                settings["courses"] = {}
-            if key not in settings["courses"]:
-                settings["courses"][key] = []
-            
-            courses = settings["courses"][key]
-            
             # Display existing courses
-            st.write(f"Current Courses for {selected_uni}, {selected_semester}:")
+            st.write(f"Current Courses for {selected_uni.name}, {selected_semester.name}:")
+            courses = filter_nodes(hierarchy, selected_semester, "manage_course")
+            stats = node_stats(courses)
             for i, course in enumerate(courses):
                 col1, col2 = st.columns([4, 1])
                 with col1:
-                    st.write(f"{i+1}. {course}")
+                    files, size = stats[course.id].get("*", (0, 0))
+                    st.write(f"{i+1}. {course.name} ({format_count(files, 'file')}, {format_size(size)})" if files else f"{i+1}. {course.name} (empty)")
                 with col2:
-                    if st.button("Remove", key=f"remove_course_{i}"):
-                        # Remove course files
-                        course_path = get_file_path(selected_uni, selected_semester, course)
-                        if os.path.exists(course_path):
-                            shutil.rmtree(course_path)
-                        courses.remove(course)
-                        save_settings(settings)
+                    if st.button("Remove", key=f"remove_course_{course.id}"):
+                        # Course files are reclaimed in the background
+                        if update_settings({"op": "remove", "id": course.id}):
+                            delete_later(get_course_path(course))
                         st.rerun()
             
             # Add new course
-            st.write(f"Add New Course for {selected_uni}, {selected_semester}:")
+            st.write(f"Add New Course for {selected_uni.name}, {selected_semester.name}:")
             new_course = st.text_input("Course Name", key="new_course_input")
             if st.button("Add Course"):
-                if new_course and new_course not in courses:
-                    courses.append(new_course)
-                    settings["courses"][key] = courses
-                    save_settings(settings)
+                clash = find_clashing_sibling(hierarchy, selected_semester, new_course) if new_course else None
+                if new_course and clash is None:
+                    finish_deletions(get_file_path(selected_uni.name, selected_semester.name, new_course))
+                    update_settings({"op": "add_course", "id": new_node_id(), "parent_id": selected_semester.id,
+                                     "name": new_course})
                     
                     # Create course directories
-                    course_path = get_file_path(selected_uni, selected_semester, new_course)
+                    course_path = get_file_path(selected_uni.name, selected_semester.name, new_course)
                     create_directory_if_not_exists(course_path)
                     create_directory_if_not_exists(course_path / "exams")
                     create_directory_if_not_exists(course_path / "sheets")
                     create_directory_if_not_exists(course_path / "tips")
                     
-                    st.success(f"Added {new_course} to {selected_uni}, {selected_semester} courses!")
+                    st.success(f"Added {new_course} to {selected_uni.name}, {selected_semester.name} courses!")
                     st.rerun()
-                elif new_course in courses:
-                    st.error(f"{new_course} already exists for {selected_uni}, {selected_semester}!")
+                elif new_course and clash.name == new_course:
+                    st.error(f"{new_course} already exists for {selected_uni.name}, {selected_semester.name}!")
+                elif new_course:
+                    st.error(f"{new_course} would share its upload folder with {clash.name}; choose another name!")
                 else:
                     st.error("Please enter a course name!")
 
+@st.fragment
 def upload_resources():
     """Admin interface for uploading resources for each course"""
     st.subheader("Upload Resources")
     
-    settings = st.session_state.settings
-    universities = settings.get("universities", [])
+    hierarchy = load_settings()
     
-    if not universities:
+    if not hierarchy.universities:
         st.warning("No universities available. Please add a university first.")
         return
     
     # Select university
-    selected_uni = st.selectbox("Select University", universities, key="upload_uni_select")
+    selected_uni = select_node("Select University", hierarchy, None, key="upload_uni_select")
     
     if selected_uni:
-        if "semesters" not in settings:
-            st.warning(f"No semesters available for {selected_uni}. Please add a semester first.")
-            return
-            
-        if selected_uni not in settings["semesters"]:
-            st.warning(f"No semesters available for {selected_uni}. Please add a semester first.")
-            return
-        
-        semesters = settings["semesters"][selected_uni]
-        
-        if not semesters:
-            st.warning(f"No semesters available for {selected_uni}. Please add a semester first.")
+        if not selected_uni.semesters:
+            st.warning(f"No semesters available for {selected_uni.name}. Please add a semester first.")
             return
         
         # Select semester
-        selected_semester = st.selectbox("Select Semester", semesters, key="upload_sem_select")
+        selected_semester = select_node("Select Semester", hierarchy, selected_uni, key="upload_sem_select")
         
         if selected_semester:
-            key = f"{selected_uni}_{selected_semester}"
-            if "courses" not in settings or key not in settings["courses"]:
-                st.warning(f"No courses available for {selected_uni}, {selected_semester}. Please add a course first.")
-                return
-            
-            courses = settings["courses"][key]
-            
-            if not courses:
-                st.warning(f"No courses available for {selected_uni}, {selected_semester}. Please add a course first.")
+            if not selected_semester.courses:
+                st.warning(f"No courses available for {selected_uni.name}, {selected_semester.name}. Please add a course first.")
                 return
             
             # Select course
-            selected_course = st.selectbox("Select Course", courses, key="upload_course_select")
+            selected_course = select_node("Select Course", hierarchy, selected_semester, key="upload_course_select")
             
             if selected_course:
                 # Select resource type
@@ -240,41 +211,230 @@ def upload_resources():
                 dir_name = type_to_dir[resource_type]
                 
                 # Get resource path
-                resource_path = get_file_path(selected_uni, selected_semester, selected_course) / dir_name
-                create_directory_if_not_exists(resource_path)
+                course_path = get_course_path(selected_course)
+                resource_path = course_path / dir_name
                 
                 # Display existing resources
-                st.write(f"Current {resource_type} for {selected_course}:")
-                existing_files = os.listdir(resource_path) if os.path.exists(resource_path) else []
+                st.write(f"Current {resource_type} for {selected_course.name}:")
+                existing_files = list_resources(course_path, dir_name)
                 
                 if existing_files:
-                    for i, file in enumerate(existing_files):
+                    for i, resource in enumerate(existing_files):
+                        file = resource["name"]
                         col1, col2 = st.columns([4, 1])
                         with col1:
                             st.write(f"{i+1}. {file}")
                         with col2:
-                            if st.button("Delete", key=f"delete_file_{i}"):
+                            if st.button("Delete", key=f"delete_file_{dir_name}_{file}"):
                                 file_path = resource_path / file
-                                if os.path.exists(file_path):
-                                    os.remove(file_path)
-                                    st.success(f"Deleted {file}!")
-                                    st.rerun()
+                                remove_thumbnail(file_path, resource["mtime_ns"], resource["size"])
+                                get_storage().delete(storage_key(file_path))
+                                remove_resource(file_path)
+                                st.success(f"Deleted {file}!")
+                                rerun_fragment()
                 else:
                     st.info(f"No {resource_type.lower()} uploaded yet.")
                 
-                # Upload new resource
-                st.write(f"Upload New {resource_type} for {selected_course}:")
-                uploaded_file = st.file_uploader(f"Choose a file for {resource_type}", key=f"file_upload_{dir_name}")
+                # Upload new resources
+                st.write(f"Upload New {resource_type} for {selected_course.name}:")
+                if "upload_message" in st.session_state:
+                    st.success(st.session_state.pop("upload_message"))
+                pending_jobs = pending_job_count()
+                if pending_jobs:
+                    st.caption(f"Extracting text and rendering previews for {pending_jobs} file(s) in the background.")
+                # Changing the key after each upload clears the uploader for the next batch
+                upload_nonce = st.session_state.get("upload_nonce", 0)
+                uploaded_files = st.file_uploader(f"Choose files for {resource_type}", accept_multiple_files=True,
+                                                  key=f"file_upload_{dir_name}_{upload_nonce}")
                 
-                if uploaded_file is not None:
-                    # Save the uploaded file
-                    file_path = resource_path / uploaded_file.name
-                    
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+                if uploaded_files:
+                    progress_bar = st.progress(0.0, text="Uploading...")
+                    items = [uploaded_file_item(uploaded_file, resource_path) for uploaded_file in uploaded_files]
+                    result = import_items(items, progress=lambda done, total: progress_bar.progress(done / total, text=f"Uploaded {done} of {total}"))
                     
-                    st.success(f"File {uploaded_file.name} uploaded successfully!")
-                    st.rerun()
+                    st.session_state.upload_message = import_summary(result)
+                    st.session_state.upload_nonce = upload_nonce + 1
+                    rerun_fragment()
+
+def import_summary(result):
+    """Describe the outcome of a bulk upload or archive import"""
+    message = f"Uploaded {len(result.added)} file(s)."
+    if result.duplicates:
+        message += f" {len(result.duplicates)} already uploaded."
+    if result.skipped:
+        message += f" {len(result.skipped)} skipped (not in university/semester/course/type/file layout)."
+    if result.errors:
+        message += " Failed: " + ", ".join(f"{name} ({error})" for name, error in result.errors)
+    return message
+
+def ensure_course(university_name, semester_name, course_name):
+    """Find a course by names, creating the university, semester and course if needed"""
+    uni = st.session_state.settings.find_university(university_name)
+    if uni is None:
+        finish_deletions(get_file_path(university_name))
+        uni_id = new_node_id()
+        update_settings({"op": "add_university", "id": uni_id, "name": university_name})
+        uni = st.session_state.settings.get(uni_id)
+    
+    semester = st.session_state.settings.find_child(uni, semester_name)
+    if semester is None:
+        finish_deletions(get_file_path(university_name, semester_name))
+        semester_id = new_node_id()
+        update_settings({"op": "add_semester", "id": semester_id, "parent_id": uni.id, "name": semester_name})
+        semester = st.session_state.settings.get(semester_id)
+    
+    course = st.session_state.settings.find_child(semester, course_name)
+    if course is None:
+        finish_deletions(get_file_path(university_name, semester_name, course_name))
+        course_id = new_node_id()
+        update_settings({"op": "add_course", "id": course_id, "parent_id": semester.id, "name": course_name})
+        course = st.session_state.settings.get(course_id)
+    return course
+
+@st.fragment
+def import_archive():
+    """Admin interface for importing a whole archive of resources at once"""
+    st.subheader("Bulk Import")
+    st.write("Upload a ZIP or tar archive laid out as `university/semester/course/type/file`, "
+             "where type is `exams`, `sheets` or `tips`. Missing universities, semesters and courses are created.")
+    
+    if "import_message" in st.session_state:
+        st.success(st.session_state.pop("import_message"))
+    import_nonce = st.session_state.get("import_nonce", 0)
+    archive = st.file_uploader("Choose an archive", type=["zip", "tar", "gz", "tgz", "bz2", "xz"],
+                               key=f"archive_upload_{import_nonce}")
+    
+    if archive is not None and st.button("Import Archive"):
+        result = ImportResult()
+        try:
+            entries = read_archive(archive, result)
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            st.error(f"Could not read archive: {e}")
+            return
+        
+        # Create missing hierarchy nodes before the workers start writing files
+        course_paths = {}
+        for entry in entries:
+            names = (entry.university, entry.semester, entry.course)
+            if names not in course_paths:
+                course_paths[names] = get_course_path(ensure_course(*names))
+        
+        items = [ImportItem(course_paths[(entry.university, entry.semester, entry.course)] / entry.resource_type,
+                            entry.name, entry.open, entry.read_lock)
+                 for entry in entries]
+        progress_bar = st.progress(0.0, text="Importing...")
+        imported = import_items(items, progress=lambda done, total: progress_bar.progress(done / total, text=f"Imported {done} of {total}"))
+        imported.skipped = result.skipped
+        
+        st.session_state.import_message = import_summary(imported)
+        st.session_state.import_nonce = import_nonce + 1
+        st.rerun()
+
+@st.fragment
+def show_statistics():
+    """Admin overview of the files and space used per university and course"""
+    st.subheader("Statistics")
+    st.write("File counts and sizes are kept up to date by the catalog as files are uploaded and deleted, "
+             "so this view never scans the upload directories.")
+    st.button("Refresh", key="refresh_statistics")
+    
+    hierarchy = load_settings()
+    universities = list(hierarchy.universities.values())
+    stats = node_stats(universities)
+    total_files = sum(stats[uni.id].get("*", (0, 0))[0] for uni in universities)
+    total_size = sum(stats[uni.id].get("*", (0, 0))[1] for uni in universities)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Files", total_files)
+    col2.metric("Storage used", format_size(total_size))
+    course_count = sum(uni.course_count() for uni in universities)
+    col3.metric("Courses", course_count)
+    
+    st.write("By university:")
+    st.dataframe([{
+        "university": uni.name,
+        **{resource_type: stats[uni.id].get(resource_type, (0, 0))[0] for resource_type in RESOURCE_TYPES},
+        "files": stats[uni.id].get("*", (0, 0))[0],
+        "size MB": round(stats[uni.id].get("*", (0, 0))[1] / 2 ** 20, 1),
+    } for uni in universities], hide_index=True)
+    
+    st.write("Largest courses:")
+    st.dataframe([{
+        "course": row["prefix"].replace("_", " ").replace("/", " › "),
+        "files": row["files"],
+        "size MB": round(row["bytes"] / 2 ** 20, 1),
+    } for row in largest_courses(20)], hide_index=True)
+    
+    indexed, empty = count_courses()
+    st.write(f"Courses without any files: {empty}")
+    if indexed < course_count:
+        # The job queue indexes every course in the background after a start
+        st.caption(f"{format_count(course_count - indexed, 'course')} not indexed yet, so not counted above")
+    if empty:
+        st.dataframe([{"course": key.replace("_", " ").replace("/", " › ")} for key in empty_course_keys(200)],
+                     hide_index=True)
+    
+    # Events reach the catalog a few seconds after they happen
+    st.write("Most downloaded in the last 30 days:")
+    st.dataframe([{
+        "file": row["name"],
+        "course": row["course_dir"].replace("_", " ").replace("/", " › "),
+        "type": row["resource_type"],
+        "downloads": row["count"],
+    } for row in top_resources(limit=20)], hide_index=True)
+    
+    st.write("Most viewed in the last 30 days:")
+    st.dataframe([{
+        "file": row["name"],
+        "course": row["course_dir"].replace("_", " ").replace("/", " › "),
+        "type": row["resource_type"],
+        "views": row["count"],
+    } for row in top_resources(kind=VIEW, limit=20)], hide_index=True)
+    
+    st.write("Daily activity:")
+    st.dataframe([{"day": day, "downloads": downloads, "views": views}
+                  for day, downloads, views in daily_totals()], hide_index=True)
+
+@st.fragment
+def show_diagnostics():
+    """Admin view of the timings and counters collected by this portal process"""
+    st.subheader("Diagnostics")
+    st.write("Measurements since this portal process started. The same metrics are served in "
+             "Prometheus format at `/metrics` on the resource file server.")
+    st.button("Refresh", key="refresh_diagnostics")
+    
+    st.write(f"Background jobs waiting: {pending_job_count()}")
+    st.write(f"Deleted universities, semesters and courses still being reclaimed: {pending_deletion_count()}")
+    cached_files, cached_bytes = byte_cache_usage()
+    st.write(f"Downloads held in memory by the file server: {format_count(cached_files, 'file')}, {format_size(cached_bytes)}")
+    
+    st.write("Recent page runs (newest first):")
+    runs = recent_runs()
+    if runs:
+        st.dataframe([{
+            "time": datetime.fromtimestamp(run["time"]).strftime("%H:%M:%S"),
+            "page": run["page"],
+            "total ms": round(run["seconds"] * 1000, 1),
+            "html KB": round(run["counters"].get("page_html_bytes_total", 0) / 1024, 1),
+            **{f"{name.removesuffix('_seconds')} ms": round(seconds * 1000, 1) for name, seconds in run["timings"].items()},
+        } for run in runs], hide_index=True)
+    else:
+        st.info("No page runs recorded yet.")
+    
+    st.write("Timings:")
+    st.dataframe([{
+        "metric": name,
+        "labels": ", ".join(f"{key}={value}" for key, value in labels.items()),
+        "count": count,
+        "mean ms": round(total / count * 1000, 2) if count else 0,
+        "total s": round(total, 3),
+    } for name, labels, count, total in histogram_summaries()], hide_index=True)
+    
+    st.write("Counters:")
+    st.dataframe([{
+        "metric": name,
+        "labels": ", ".join(f"{key}={value}" for key, value in labels.items()),
+        "value": value,
+    } for name, labels, value in counter_values()], hide_index=True)
 
 def show_admin_panel():
     """Display the admin panel"""
@@ -303,7 +463,7 @@ def show_admin_panel():
     
     # Create tabs for different admin functions with custom styling
     st.markdown('<div class="admin-section">', unsafe_allow_html=True)
-    tab1, tab2, tab3, tab4 = st.tabs(["Universities", "Semesters", "Courses", "Upload Resources"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Universities", "Semesters", "Courses", "Upload Resources", "Bulk Import", "Statistics", "Diagnostics"])
     
     with tab1:
         manage_universities()
@@ -316,5 +476,14 @@ def show_admin_panel():
     
     with tab4:
         upload_resources()
+    
+    with tab5:
+        import_archive()
+    
+    with tab6:
+        show_statistics()
+    
+    with tab7:
+        show_diagnostics()
         
     st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from catalog import get_connection, resource_key
+from config import ANALYTICS_BUFFER_SIZE, ANALYTICS_FLUSH_INTERVAL, ANALYTICS_RETENTION_DAYS
+from metrics import increment, timed
+
+logger = logging.getLogger(__name__)
+
+# Kinds of recorded events
+DOWNLOAD = "download"
+VIEW = "view"
+
+# Events waiting to be written, as (kind, course_dir, resource_type, name, time) tuples
+_buffer = []
+_buffer_lock = threading.Lock()
+
+# Serializes flushes of the writer thread with the final flush at exit
+_flush_lock = threading.Lock()
+
+
+def record_events(kind, file_paths):
+    """Queue one event per file for the writer thread; never touches the database.
+
+    Events beyond ANALYTICS_BUFFER_SIZE are dropped rather than slowing the caller down.
+    """
+    now = time.time()
+    events = [(kind, *resource_key(file_path), now) for file_path in file_paths]
+    with _buffer_lock:
+        room = ANALYTICS_BUFFER_SIZE - len(_buffer)
+        _buffer.extend(events[:max(room, 0)])
+    if len(events) > room:
+        increment("analytics_events_dropped_total", len(events) - max(room, 0))
+
+
+def record_event(kind, file_path):
+    record_events(kind, [file_path])
+
+
+def flush():
+    """Write the buffered events and their daily totals in one transaction; return how many were written"""
+    global _buffer
+    with _flush_lock:
+        with _buffer_lock:
+            events, _buffer = _buffer, []
+        if not events:
+            return 0
+
+        daily = Counter((time.strftime("%Y-%m-%d", time.localtime(created_at)), kind, course_dir, resource_type, name)
+                        for kind, course_dir, resource_type, name, created_at in events)
+        conn = get_connection()
+        with timed("analytics_flush_seconds"), conn:
+            conn.executemany(
+                "INSERT INTO resource_events (kind, course_dir, resource_type, name, created_at) VALUES (?, ?, ?, ?, ?)",
+                events,
+            )
+            conn.executemany(
+                "INSERT INTO resource_daily (day, kind, course_dir, resource_type, name, count) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (course_dir, resource_type, name, kind, day) DO UPDATE SET count = count + excluded.count",
+                [(*key, count) for key, count in daily.items()],
+            )
+        increment("analytics_events_total", len(events))
+        return len(events)
+
+
+def prune_events():
+    """Drop raw events older than the retention period; the daily totals are kept"""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM resource_events WHERE created_at < ?",
+                     (time.time() - ANALYTICS_RETENTION_DAYS * 86400,))
+
+
+def _since(days):
+    return time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400))
+
+
+def top_resources(course_dir=None, kind=DOWNLOAD, days=30, limit=10):
+    """Return the resources with the most events over the last `days` days, optionally within one course.
+
+    Rows have course_dir, resource_type, name and count.
+    """
+    course_filter = "AND course_dir = ? " if course_dir is not None else ""
+    return get_connection().execute(
+        "SELECT course_dir, resource_type, name, SUM(count) AS count FROM resource_daily "
+        f"WHERE kind = ? AND day >= ? {course_filter}"
+        "GROUP BY course_dir, resource_type, name ORDER BY count DESC LIMIT ?",
+        (kind, _since(days), *([course_dir] if course_dir is not None else []), limit),
+    ).fetchall()
+
+
+def daily_totals(days=30):
+    """Return (day, downloads, views) for each of the last `days` days that had any events"""
+    return get_connection().execute(
+        "SELECT day, SUM(CASE WHEN kind = ? THEN count ELSE 0 END), SUM(CASE WHEN kind = ? THEN count ELSE 0 END) "
+        "FROM resource_daily WHERE kind IN (?, ?) AND day >= ? GROUP BY day ORDER BY day DESC",
+        (DOWNLOAD, VIEW, DOWNLOAD, VIEW, _since(days)),
+    ).fetchall()
+
+
+class AnalyticsWriter:
+    """Writes buffered events to the catalog in batches on a background thread"""
+
+    def __init__(self, interval=ANALYTICS_FLUSH_INTERVAL):
+        self.interval = interval
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="analytics-writer", daemon=True)
+        self.thread.start()
+        # Keep the events of the last interval when the portal stops
+        atexit.register(flush)
+        return self
+
+    def run(self):
+        next_prune = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            try:
+                flush()
+                if time.monotonic() >= next_prune:
+                    prune_events()
+                    next_prune = time.monotonic() + 86400
+            except Exception:
+                # Keep writing; the events of a failed batch are lost, not retried forever
+                logger.exception("Could not write analytics events")
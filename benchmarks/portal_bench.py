@@ -0,0 +1,292 @@
+"""Benchmarks for the student browse and admin upload paths.
+
+Builds a synthetic portal (universities x semesters x courses x files) in a
+scratch directory, drives main.py headlessly with Streamlit's AppTest and
+records, per scenario, rerun latency, peak RSS and the size of the page sent
+to the browser. Results are written as JSON to benchmarks/results/ so runs
+of different versions can be compared:
+
+    python benchmarks/portal_bench.py --preset small
+    python benchmarks/portal_bench.py --preset small --compare benchmarks/results/<earlier run>.json
+
+The "full" preset describes 50 universities x 10 semesters x 40 courses, but
+only --populated-courses of them get files, since creating four million
+files would dominate the run.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+PRESETS = {
+    "small": {"universities": 2, "semesters": 2, "courses": 5, "files": 50, "populated_courses": 20},
+    "medium": {"universities": 10, "semesters": 4, "courses": 10, "files": 200, "populated_courses": 20},
+    "full": {"universities": 50, "semesters": 10, "courses": 40, "files": 200, "populated_courses": 20},
+}
+
+# Synthetic files cycle through these (resource type, extension, size in bytes)
+FILE_KINDS = (
+    ("exams", ".pdf", 900 * 1024),
+    ("exams", ".png", 250 * 1024),
+    ("sheets", ".pdf", 2 * 1024 * 1024),
+    ("tips", ".txt", 6 * 1024),
+    ("tips", ".jpg", 120 * 1024),
+)
+
+# Files uploaded at once in the admin upload scenario
+UPLOAD_BATCH = 20
+
+
+def file_header(name, extension):
+    """Return the distinct leading bytes of a synthetic file; images are real so thumbnails work"""
+    if extension not in (".png", ".jpg"):
+        return name.encode()
+    from PIL import Image
+    color = tuple(hashlib.sha1(name.encode()).digest()[:3])
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, "PNG" if extension == ".png" else "JPEG")
+    return buffer.getvalue() + name.encode()
+
+
+def generate_portal(data_dir, universities, semesters, courses, files, populated_courses):
+    """Write settings.json and synthetic resources; return the populated course paths"""
+    from hierarchy import Hierarchy
+    from utils import get_course_path
+
+    hierarchy = Hierarchy()
+    for u in range(universities):
+        uni = hierarchy.add_university(f"University {u:02}")
+        for s in range(semesters):
+            semester = hierarchy.add_semester(uni.id, f"Semester {s + 1}")
+            for c in range(courses):
+                hierarchy.add_course(semester.id, f"Course {c:02}")
+    (data_dir / "settings.json").write_text(json.dumps(hierarchy.to_dict()))
+
+    course_paths = []
+    for uni in hierarchy.universities.values():
+        for semester in uni.semesters.values():
+            for course in semester.courses.values():
+                if len(course_paths) == populated_courses:
+                    return course_paths
+                course_path = get_course_path(course)
+                for i in range(files):
+                    resource_type, extension, size = FILE_KINDS[i % len(FILE_KINDS)]
+                    file_path = course_path / resource_type / f"{resource_type} {i:04} 20{10 + i % 15}{extension}"
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    with open(file_path, "wb") as f:
+                        # Distinct leading bytes keep the content hashes apart; the rest is sparse
+                        f.write(file_header(str(file_path), extension))
+                        f.truncate(size)
+                course_paths.append(course_path)
+    return course_paths
+
+
+def payload_bytes(at):
+    """Size of the elements of the last run as sent to the browser"""
+    from streamlit.testing.v1.element_tree import Block
+    return sum(node.proto.ByteSize() for node in at._tree if not isinstance(node, Block) and node.proto is not None)
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class Recorder:
+    """Collects the measurements of every scenario"""
+
+    def __init__(self):
+        self.scenarios = {}
+
+    def run(self, name, at, action=None):
+        """Time one rerun of an AppTest, optionally after a widget interaction"""
+        start = time.perf_counter()
+        (action or (lambda: at))().run()
+        elapsed = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(f"{name}: {[e.message for e in at.exception]}")
+        scenario = self.scenarios.setdefault(name, {"seconds": [], "payload_bytes": 0})
+        scenario["seconds"].append(elapsed)
+        scenario["payload_bytes"] = max(scenario["payload_bytes"], payload_bytes(at))
+        scenario["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        scenario["rss_mb"] = round(current_rss_mb(), 1)
+
+    def summary(self):
+        result = {}
+        for name, scenario in self.scenarios.items():
+            times = sorted(scenario["seconds"])
+            result[name] = {
+                "runs": len(times),
+                "median_ms": round(statistics.median(times) * 1000, 2),
+                "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 2),
+                "min_ms": round(times[0] * 1000, 2),
+                "max_ms": round(times[-1] * 1000, 2),
+                "payload_bytes": scenario["payload_bytes"],
+                "peak_rss_mb": scenario["peak_rss_mb"],
+                "rss_mb": scenario["rss_mb"],
+            }
+        return result
+
+
+def new_app(admin=False):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(str(REPO_DIR / "main.py"), default_timeout=600)
+    at.session_state["is_admin"] = admin
+    return at
+
+
+def bench_student(recorder, repeat):
+    at = new_app()
+    recorder.run("student_first_view", at)
+    for _ in range(repeat):
+        recorder.run("student_rerun", at)
+
+    # Each newly selected course is indexed on its first view
+    course_select = at.selectbox[2]
+    for option in course_select.options[1:repeat + 1]:
+        recorder.run("student_switch_course", at, lambda: at.selectbox[2].set_value(option))
+
+    for _ in range(repeat):
+        for tab in ("Study Sheets", "Tips & Guides", "Past Exams"):
+            recorder.run("student_switch_tab", at, lambda: at.segmented_control(key="resource_tab").set_value(tab))
+
+    next_buttons = [button for button in at.button if button.key and button.key.endswith("_next")]
+    if next_buttons:
+        recorder.run("student_next_page", at, lambda: at.button(key=next_buttons[0].key).click())
+
+    for i in range(repeat):
+        recorder.run("student_search", at, lambda: at.text_input(key="search_query").input(f"exams 20{10 + i % 15}"))
+
+
+def bench_admin_upload(recorder, repeat):
+    at = new_app(admin=True)
+    recorder.run("admin_first_view", at)
+    course_select = at.selectbox(key="upload_course_select")
+    recorder.run("admin_upload_select_course", at, lambda: course_select.set_value(course_select.options[0]))
+    for _ in range(repeat):
+        recorder.run("admin_upload_rerun", at)
+
+    uploader = at.file_uploader[0]
+    if not hasattr(uploader, "set_value"):
+        print("This Streamlit version cannot simulate uploads; skipping admin_upload_batch")
+        return
+    for batch in range(repeat):
+        files = []
+        for i in range(UPLOAD_BATCH):
+            _, extension, size = FILE_KINDS[i % len(FILE_KINDS)]
+            name = f"upload {batch} {i}{extension}"
+            files.append((name, file_header(name, extension).ljust(size // 8, b"\0"), "application/octet-stream"))
+        recorder.run("admin_upload_batch", at, lambda: at.file_uploader[0].set_value(files))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    """Print how each scenario changed against an earlier result file"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    if baseline["meta"]["size"] != results["meta"]["size"] or baseline["meta"]["repeat"] != results["meta"]["repeat"]:
+        print(f"\nNote: {baseline_path} was measured with a different catalog size or repeat count")
+    print(f"\n{'scenario':30} {'median ms':>22} {'payload bytes':>26} {'peak RSS MB':>20}")
+    for name, current in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            print(f"{name:30} {'(new)':>22}")
+            continue
+        cells = []
+        for field in ("median_ms", "payload_bytes", "peak_rss_mb"):
+            change = (current[field] - before[field]) / before[field] * 100 if before[field] else 0.0
+            cells.append(f"{before[field]} -> {current[field]} ({change:+.0f}%)")
+        print(f"{name:30} {cells[0]:>22} {cells[1]:>26} {cells[2]:>20}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    parser.add_argument("--universities", type=int)
+    parser.add_argument("--semesters", type=int)
+    parser.add_argument("--courses", type=int, help="courses per semester")
+    parser.add_argument("--files", type=int, help="files per populated course")
+    parser.add_argument("--populated-courses", type=int, help="number of courses that get files")
+    parser.add_argument("--repeat", type=int, default=5, help="measured reruns per scenario")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--output", help="where to write the results (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    size = dict(PRESETS[args.preset])
+    for name in size:
+        if getattr(args, name) is not None:
+            size[name] = getattr(args, name)
+
+    # The portal reads and writes ./data, so it runs inside a scratch directory
+    work_dir = Path(tempfile.mkdtemp(prefix="portal-bench-"))
+    os.chdir(work_dir)
+    os.environ.setdefault("RESOURCE_SERVER_PORT", "0")
+    os.environ.setdefault("JOB_WORKERS", "1")
+    sys.path.insert(0, str(REPO_DIR))
+    (work_dir / "data" / "uploads").mkdir(parents=True)
+
+    start = time.perf_counter()
+    populated = generate_portal(work_dir / "data", **size)
+    print(f"Generated {len(populated)} populated courses in {time.perf_counter() - start:.1f}s under {work_dir}")
+
+    recorder = Recorder()
+    bench_student(recorder, args.repeat)
+    bench_admin_upload(recorder, args.repeat)
+    scenarios = recorder.summary()
+
+    import streamlit
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "platform": platform.platform(),
+            "preset": args.preset,
+            "size": size,
+            "repeat": args.repeat,
+        },
+        "scenarios": scenarios,
+    }
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{results['meta']['revision']}-{args.preset}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    print(f"\n{'scenario':30} {'runs':>5} {'median ms':>10} {'p95 ms':>10} {'payload B':>10} {'peak RSS MB':>12}")
+    for name, scenario in scenarios.items():
+        print(f"{name:30} {scenario['runs']:>5} {scenario['median_ms']:>10} {scenario['p95_ms']:>10} "
+              f"{scenario['payload_bytes']:>10} {scenario['peak_rss_mb']:>12}")
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Check the S3 storage backend against a real bucket, such as a local MinIO.
+
+Runs every StorageBackend operation through two S3Storage instances with
+separate local copies, the way two portal replicas share one bucket, and
+times each step. Objects are written below a random prefix that is removed
+afterwards; the bucket is created if it does not exist:
+
+    docker run -p 9000:9000 minio/minio server /data
+    AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin AWS_DEFAULT_REGION=us-east-1 \\
+        python benchmarks/storage_check.py --endpoint-url http://localhost:9000 --bucket portal-check
+
+Exits with a non-zero status at the first step that does not behave as the
+portal expects.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def run_checks(replica_a, replica_b, course):
+    """Yield (step name, seconds) for each check, raising AssertionError on a failure"""
+    from storage import StoredObject
+
+    exam, sheet = f"{course}/exams/final.pdf", f"{course}/sheets/week1.pdf"
+    content = os.urandom(256 * 1024)
+
+    def step(name, fn):
+        start = time.perf_counter()
+        fn()
+        return name, time.perf_counter() - start
+
+    def put():
+        replica_a.put(exam, io.BytesIO(content))
+        stored = replica_a.stat(exam)
+        check(isinstance(stored, StoredObject) and stored.size == len(content), "stat after put reports another size")
+
+    def put_file():
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(b"week 1")
+            tmp.flush()
+            replica_a.put_file(sheet, tmp.name, exclusive=True)
+            try:
+                replica_a.put_file(sheet, tmp.name, exclusive=True)
+            except FileExistsError:
+                pass
+            else:
+                raise AssertionError("exclusive put_file replaced an existing object")
+        check(replica_a.local_path(sheet).read_bytes() == b"week 1", "put_file kept no local copy")
+
+    def list_course():
+        keys = {obj.key for obj in replica_b.list(course)}
+        check(keys == {exam, sheet}, f"list returned {sorted(keys)}")
+        check(not list(replica_b.list(f"{course}/exams/final")), "list matched a partial name")
+
+    def read_other_replica():
+        with replica_b.open(exam) as stream:
+            check(stream.read() == content, "open returned other content")
+        check(replica_b.local_path(exam).read_bytes() == content, "local_path fetched other content")
+
+    def replace_elsewhere():
+        replica_a.put(exam, io.BytesIO(b"replaced"))
+        check(replica_b.local_path(exam).read_bytes() == content, "the stale local copy should be kept until dropped")
+        replica_b.drop_local_copy(exam)
+        check(replica_b.local_path(exam).read_bytes() == b"replaced", "drop_local_copy did not refetch")
+
+    def rename():
+        renamed = f"{course}/exams/final-2024.pdf"
+        replica_b.rename(exam, renamed)
+        check(not replica_a.exists(exam) and replica_a.stat(renamed).size == len(b"replaced"), "rename lost the object")
+        check(replica_b.local_path(renamed).read_bytes() == b"replaced", "rename lost the local copy")
+        replica_b.delete(renamed)
+        check(not replica_a.exists(renamed), "delete left the object")
+
+    def missing():
+        for fn in (replica_a.stat, replica_a.local_path):
+            try:
+                fn(f"{course}/exams/missing.pdf")
+            except FileNotFoundError:
+                continue
+            raise AssertionError(f"{fn.__name__} of a missing object did not raise FileNotFoundError")
+        replica_a.delete(f"{course}/exams/missing.pdf")
+
+    def many_objects():
+        # More than one page of listing and one DeleteObjects request
+        for i in range(1100):
+            replica_a.put(f"{course}/tips/{i:04}.txt", io.BytesIO(b"tip"))
+        check(sum(1 for _ in replica_b.list(f"{course}/tips")) == 1100, "list did not page through every object")
+        replica_b.delete_prefix(course)
+        check(not list(replica_a.list(course)), "delete_prefix left objects behind")
+
+    for name, fn in (("put", put), ("put_file", put_file), ("list", list_course),
+                     ("read from another replica", read_other_replica), ("replace elsewhere", replace_elsewhere),
+                     ("rename and delete", rename), ("missing objects", missing), ("1100 objects", many_objects)):
+        yield step(name, fn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--bucket", default=os.environ.get("S3_BUCKET", "portal-check"))
+    parser.add_argument("--endpoint-url", default=os.environ.get("S3_ENDPOINT_URL", ""))
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(REPO_DIR))
+    from storage import LocalStorage, S3Storage
+
+    prefix = f"storage-check-{uuid.uuid4().hex[:8]}"
+    with tempfile.TemporaryDirectory() as cache_a, tempfile.TemporaryDirectory() as cache_b:
+        replica_a = S3Storage(args.bucket, prefix, args.endpoint_url, cache=LocalStorage(cache_a))
+        replica_b = S3Storage(args.bucket, prefix, args.endpoint_url, cache=LocalStorage(cache_b))
+        try:
+            replica_a.client.head_bucket(Bucket=args.bucket)
+        except Exception:
+            replica_a.client.create_bucket(Bucket=args.bucket)
+
+        print(f"Checking s3://{args.bucket}/{prefix} at {args.endpoint_url or 'AWS'}")
+        try:
+            for name, seconds in run_checks(replica_a, replica_b, "Uni/Semester/Course"):
+                print(f"  ok  {name:28} {seconds * 1000:>9.1f} ms")
+        except AssertionError as e:
+            print(f"  FAILED: {e}")
+            sys.exit(1)
+        finally:
+            replica_a.delete_prefix("Uni")
+    print("S3 storage backend behaves as expected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import tarfile
+import threading
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import partial
+from pathlib import PurePosixPath
+
+from catalog import add_resources, find_resource_by_hash
+from config import BULK_IMPORT_WORKERS
+from ingest import link_into_directory, store_blob
+from storage import get_storage, storage_key
+from extraction import can_extract
+from jobs import enqueue_jobs
+from thumbnails import can_preview, generate_thumbnail, is_image
+from transcode import can_transcode
+
+# Directory names accepted for each resource type inside an archive
+RESOURCE_TYPE_ALIASES = {
+    "exams": "exams", "exam": "exams", "past exams": "exams",
+    "sheets": "sheets", "study sheets": "sheets",
+    "tips": "tips", "notes": "tips", "tips & notes": "tips", "tips & guides": "tips",
+}
+
+# One file to import. `open` returns a binary stream of its content and
+# `read_lock` (if set) must be held while reading it.
+ImportItem = namedtuple("ImportItem", ["resource_dir", "name", "open", "read_lock"])
+
+# One file found in an archive laid out as university/semester/course/type/file
+ArchiveEntry = namedtuple("ArchiveEntry", ["university", "semester", "course", "resource_type", "name", "open", "read_lock"])
+
+
+class ImportResult:
+    """Outcome of a bulk import"""
+
+    def __init__(self):
+        self.added = []
+        self.duplicates = []
+        self.skipped = []
+        self.errors = []
+
+
+def uploaded_file_item(uploaded_file, resource_dir):
+    """Wrap a file from st.file_uploader as an import item"""
+    def open_upload():
+        uploaded_file.seek(0)
+        return uploaded_file
+    return ImportItem(resource_dir, uploaded_file.name, open_upload, None)
+
+
+def parse_archive_path(path):
+    """Split an archive member path into (university, semester, course, type, file name).
+
+    Returns None for entries that do not follow the expected layout.
+    """
+    parts = PurePosixPath(path).parts
+    if len(parts) != 5:
+        return None
+    # Hidden entries (e.g. __MACOSX, .DS_Store) and path tricks are ignored
+    if any(part.startswith((".", "__")) for part in parts):
+        return None
+    resource_type = RESOURCE_TYPE_ALIASES.get(parts[3].lower())
+    if resource_type is None:
+        return None
+    return parts[0], parts[1], parts[2], resource_type, parts[4]
+
+
+def read_archive(archive, result):
+    """List the files of a ZIP or tar archive that follow the portal layout.
+
+    Entries that cannot be placed are recorded in result.skipped.
+    """
+    entries = []
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        zf = zipfile.ZipFile(archive)
+        # ZipFile serializes access to the underlying file, so members can be read in parallel
+        members = [(info.filename, partial(zf.open, info), None) for info in zf.infolist() if not info.is_dir()]
+    else:
+        archive.seek(0)
+        tf = tarfile.open(fileobj=archive, mode="r:*")
+        lock = threading.Lock()
+        members = [(member.name, partial(tf.extractfile, member), lock) for member in tf.getmembers() if member.isfile()]
+
+    for name, opener, lock in members:
+        parsed = parse_archive_path(name)
+        if parsed is None:
+            result.skipped.append(name)
+        else:
+            entries.append(ArchiveEntry(*parsed, opener, lock))
+    return entries
+
+
+def import_items(items, progress=None, workers=BULK_IMPORT_WORKERS):
+    """Ingest files on a worker pool and record them in the catalog in one commit.
+
+    Text extraction, PDF previews and photo re-encoding are queued as background
+    jobs rather than done here.
+
+    `progress(done, total)` is called from the calling thread as files finish.
+    """
+    result = ImportResult()
+    seen = set()
+    seen_lock = threading.Lock()
+
+    def ingest(item):
+        with item.read_lock or nullcontext():
+            with item.open() as stream:
+                sha256, blob = store_blob(stream)
+
+        course_path = item.resource_dir.parent
+        resource_type = item.resource_dir.name
+        # Skip content the course already has, including earlier files of this batch
+        with seen_lock:
+            key = (str(course_path), resource_type, sha256)
+            if key in seen or find_resource_by_hash(course_path, resource_type, sha256):
+                return None
+            seen.add(key)
+
+        file_path = link_into_directory(blob, item.resource_dir, item.name)
+        thumbnail_status = "none"
+        if is_image(file_path):
+            thumbnail_status = "ready" if generate_thumbnail(file_path) else "failed"
+        return file_path, sha256, thumbnail_status
+
+    def record(item, future):
+        try:
+            entry = future.result()
+        except Exception as e:
+            result.errors.append((item.name, str(e)))
+        else:
+            if entry is None:
+                result.duplicates.append(item.name)
+            else:
+                result.added.append(entry)
+
+    futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(ingest, item): item for item in items}
+            total = len(futures)
+            for done, future in enumerate(as_completed(futures), 1):
+                record(futures.pop(future), future)
+                if progress:
+                    progress(done, total)
+    finally:
+        # Files linked after the loop stopped early (e.g. a rerun interrupting the
+        # upload) are catalogued too, or they would never show up
+        for future, item in futures.items():
+            if future.done() and not future.cancelled():
+                record(item, future)
+        try:
+            add_resources(result.added)
+        except BaseException:
+            # Nothing would ever show or collect files the catalog does not know about
+            for file_path, _, _ in result.added:
+                get_storage().delete(storage_key(file_path))
+            raise
+
+    enqueue_jobs("extract_text", [file_path for file_path, _, _ in result.added if can_extract(file_path.name)])
+    # Rasterizing PDFs is slower than shrinking images, so their previews are rendered in the background
+    enqueue_jobs("render_preview", [file_path for file_path, _, _ in result.added
+                                    if can_preview(file_path) and not is_image(file_path)])
+    enqueue_jobs("transcode_image", [file_path for file_path, _, _ in result.added if can_transcode(file_path)])
+    return result
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import threading
+import zipfile
+from pathlib import Path
+
+from catalog import RESOURCE_TYPES, course_key, get_course_version, list_resources
+from config import BUNDLE_CACHE_MAX_BYTES, BUNDLE_DIR
+from thumbnails import IMAGE_EXTENSIONS
+
+# Formats that are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = ('.pdf', '.zip', '.gz', '.docx', '.pptx', '.xlsx', '.mp4', '.mp3') + IMAGE_EXTENSIONS
+
+# Name of the bundle holding every resource type of a course
+ALL_TYPES = "all"
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def bundle_name(course_path, resource_type):
+    """Return the cache file name prefix shared by every version of a bundle"""
+    identity = f"{course_key(course_path)}\0{resource_type}"
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+def build_lock(name):
+    """Return the lock serializing builds of one bundle"""
+    with _build_locks_lock:
+        return _build_locks.setdefault(name, threading.Lock())
+
+
+def bundle_entries(course_path, resource_type):
+    """List (file path, name inside the archive) for the files of a bundle.
+
+    Only catalogued resources are listed; the course is never indexed here.
+    """
+    resource_types = RESOURCE_TYPES if resource_type == ALL_TYPES else (resource_type,)
+    entries = []
+    for current_type in resource_types:
+        for resource in list_resources(course_path, current_type, index=False):
+            arcname = resource["name"] if resource_type != ALL_TYPES else f"{current_type}/{resource['name']}"
+            entries.append((Path(course_path) / current_type / resource["name"], arcname))
+    return entries
+
+
+def bundle_path(course_path, resource_type):
+    """Return where the bundle of the course's current catalog version is cached"""
+    return BUNDLE_DIR / f"{bundle_name(course_path, resource_type)}-{get_course_version(course_path)}.zip"
+
+
+def cached_bundle(course_path, resource_type=ALL_TYPES):
+    """Return the cached ZIP of a course's resources, or None if it has not been built"""
+    path = bundle_path(course_path, resource_type)
+    try:
+        # Refresh the modification time so eviction treats it as recently used
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+class _StreamWriter:
+    """Unseekable file object passing what the ZIP writer produces to `write` and an optional copy"""
+
+    def __init__(self, write, copy=None):
+        self._write = write
+        self.copy = copy
+
+    def write(self, data):
+        self._write(data)
+        if self.copy is not None:
+            self.copy.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def stream_bundle(course_path, resource_type, entries, write):
+    """Build the ZIP of `entries` (see bundle_entries) while passing it to `write`.
+
+    The first byte goes out as soon as the first file is compressed. The
+    request that gets to build a bundle first also writes it to the cache, so
+    later requests are served from disk; concurrent requests just stream
+    their own copy. A build interrupted by the client is not cached.
+    """
+    name = bundle_name(course_path, resource_type)
+    path = bundle_path(course_path, resource_type)
+    lock = build_lock(name)
+    caching = lock.acquire(blocking=False)
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        copy = None
+        if caching:
+            BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+            copy = open(tmp_path, "wb")
+        try:
+            # Without a seekable output, sizes and CRCs follow each file's data
+            with zipfile.ZipFile(_StreamWriter(write, copy), "w", zipfile.ZIP_DEFLATED, strict_timestamps=False) as zf:
+                for file_path, arcname in entries:
+                    compress_type = zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) else None
+                    try:
+                        zf.write(file_path, arcname, compress_type=compress_type)
+                    except FileNotFoundError:
+                        continue  # Deleted while the bundle was being built
+        finally:
+            if copy is not None:
+                copy.close()
+        if caching:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if caching:
+            tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if caching:
+            lock.release()
+
+    if caching:
+        # Earlier versions of this bundle can no longer be requested
+        for old_path in BUNDLE_DIR.glob(f"{name}-*.zip"):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+        evict_bundles(keep=path)
+
+
+def evict_bundles(max_bytes=BUNDLE_CACHE_MAX_BYTES, keep=None):
+    """Delete the least recently used bundles until the cache fits its budget.
+
+    `keep` is a bundle about to be sent, which is never evicted.
+    """
+    entries = []
+    for entry in os.scandir(BUNDLE_DIR):
+        if entry.is_file() and entry.name.endswith(".zip") and entry.path != str(keep):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def remove_bundles(course_path):
+    """Delete every cached bundle of a deleted course"""
+    for resource_type in RESOURCE_TYPES + (ALL_TYPES,):
+        for path in BUNDLE_DIR.glob(f"{bundle_name(course_path, resource_type)}-*.zip"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+
+from config import BYTE_CACHE_MAX_BYTES, BYTE_CACHE_MAX_FILE_BYTES
+from metrics import increment
+
+# Files requested once recently; a second request admits them to the cache
+SEEN_ENTRIES = 4096
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # path -> (mtime_ns, size, content), least recently used first
+_seen = OrderedDict()     # path -> None, oldest first
+_size = 0
+
+
+def _discard(key):
+    global _size
+    _size -= len(_entries.pop(key)[2])
+
+
+def get_bytes(file_path, stat, max_bytes=BYTE_CACHE_MAX_BYTES):
+    """Return the content of a file from memory, or None when it should be read from disk.
+
+    `stat` is the file's current os.stat result: an entry cached for another
+    mtime or size is dropped. A file is only cached on its second request
+    within the last SEEN_ENTRIES distinct files, so files fetched once do not
+    push out the hot ones. Least recently used files are evicted to stay
+    within `max_bytes`.
+    """
+    global _size
+    key = str(file_path)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                _entries.move_to_end(key)
+                increment("byte_cache_hits_total")
+                return entry[2]
+            _discard(key)
+        increment("byte_cache_misses_total")
+        if stat.st_size > min(BYTE_CACHE_MAX_FILE_BYTES, max_bytes):
+            return None
+        if key not in _seen:
+            _seen[key] = None
+            if len(_seen) > SEEN_ENTRIES:
+                _seen.popitem(last=False)
+            return None
+        del _seen[key]
+
+    with open(file_path, "rb") as f:
+        content = f.read()
+        # The file may have been replaced since it was stat'ed; cache only the version asked for
+        current = os.fstat(f.fileno())
+    if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+        return None
+
+    with _lock:
+        if key in _entries:
+            _discard(key)
+        _entries[key] = (stat.st_mtime_ns, stat.st_size, content)
+        _size += len(content)
+        while _size > max_bytes:
+            _discard(next(iter(_entries)))
+            increment("byte_cache_evictions_total")
+    increment("byte_cache_admissions_total")
+    return content
+
+
+def byte_cache_usage():
+    """Return (files, bytes) held in the cache"""
+    with _lock:
+        return len(_entries), _size
@@ -0,0 +1,645 @@
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import CATALOG_PATH, CATALOG_SYNC_INTERVAL, UPLOADS_DIR
+from metrics import timed
+from storage import get_storage
+
+# Sub-directories of a course holding each kind of resource
+RESOURCE_TYPES = ("exams", "sheets", "tips")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    course_dir TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mime_type TEXT NOT NULL,
+    sha256 TEXT,
+    thumbnail_status TEXT NOT NULL DEFAULT 'none',
+    page_count INTEGER,
+    -- Content as uploaded, for files that were re-encoded after upload
+    original_sha256 TEXT,
+    -- Set once text extraction has run, even if it found no text
+    text_extracted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (course_dir, resource_type, name)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS resources_by_sha256 ON resources (sha256);
+CREATE INDEX IF NOT EXISTS resources_by_original_sha256 ON resources (original_sha256)
+WHERE original_sha256 IS NOT NULL;
+
+-- One row per course that has been indexed; version changes on every edit.
+-- synced_at is when the course was last compared with shared storage.
+CREATE TABLE IF NOT EXISTS courses (
+    course_dir TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS resources_after_insert AFTER INSERT ON resources BEGIN
+    INSERT INTO courses (course_dir, version) VALUES (NEW.course_dir, 1)
+    ON CONFLICT (course_dir) DO UPDATE SET version = version + 1;
+END;
+
+-- Only columns that rendered cards and bundles depend on; e.g. recording
+-- that text was extracted must not drop them
+CREATE TRIGGER IF NOT EXISTS resources_after_change
+AFTER UPDATE OF course_dir, resource_type, name, size, mtime_ns, sha256, thumbnail_status, page_count
+ON resources BEGIN
+    UPDATE courses SET version = version + 1 WHERE course_dir IN (OLD.course_dir, NEW.course_dir);
+END;
+
+-- Replaced by resources_after_change, which is created first so no update goes uncounted
+DROP TRIGGER IF EXISTS resources_after_update;
+
+CREATE TRIGGER IF NOT EXISTS resources_after_delete AFTER DELETE ON resources BEGIN
+    UPDATE courses SET version = version + 1 WHERE course_dir = OLD.course_dir;
+END;
+
+-- Full-text search. FTS5 needs integer row IDs, so every resource gets a
+-- search document whose ID is the rowid of its entry in search_index.
+CREATE TABLE IF NOT EXISTS search_documents (
+    id INTEGER PRIMARY KEY,
+    course_dir TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (course_dir, resource_type, name)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    name, course, resource_type, body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS search_documents_after_insert AFTER INSERT ON search_documents BEGIN
+    INSERT INTO search_index (rowid, name, course, resource_type, body)
+    VALUES (NEW.id, NEW.name, NEW.course_dir, NEW.resource_type, '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_documents_after_update AFTER UPDATE ON search_documents BEGIN
+    UPDATE search_index SET name = NEW.name, course = NEW.course_dir, resource_type = NEW.resource_type
+    WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_documents_after_delete AFTER DELETE ON search_documents BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS resources_search_after_insert AFTER INSERT ON resources BEGIN
+    INSERT OR IGNORE INTO search_documents (course_dir, resource_type, name)
+    VALUES (NEW.course_dir, NEW.resource_type, NEW.name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS resources_search_after_rename
+AFTER UPDATE OF course_dir, resource_type, name ON resources BEGIN
+    UPDATE search_documents SET course_dir = NEW.course_dir, resource_type = NEW.resource_type, name = NEW.name
+    WHERE course_dir = OLD.course_dir AND resource_type = OLD.resource_type AND name = OLD.name;
+END;
+
+CREATE TRIGGER IF NOT EXISTS resources_search_after_delete AFTER DELETE ON resources BEGIN
+    DELETE FROM search_documents
+    WHERE course_dir = OLD.course_dir AND resource_type = OLD.resource_type AND name = OLD.name;
+END;
+
+-- Background work on resources, e.g. text extraction (see jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    course_dir TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_by_resource ON jobs (course_dir, resource_type, name);
+
+CREATE TRIGGER IF NOT EXISTS resources_jobs_after_rename
+AFTER UPDATE OF course_dir, resource_type, name ON resources BEGIN
+    UPDATE jobs SET course_dir = NEW.course_dir, resource_type = NEW.resource_type, name = NEW.name
+    WHERE course_dir = OLD.course_dir AND resource_type = OLD.resource_type AND name = OLD.name;
+END;
+
+CREATE TRIGGER IF NOT EXISTS resources_jobs_after_delete AFTER DELETE ON resources BEGIN
+    DELETE FROM jobs
+    WHERE course_dir = OLD.course_dir AND resource_type = OLD.resource_type AND name = OLD.name;
+END;
+
+-- Universities, semesters and courses deleted from the hierarchy whose files
+-- and catalog entries are still being reclaimed (see cleanup.py)
+CREATE TABLE IF NOT EXISTS tombstones (
+    id INTEGER PRIMARY KEY,
+    prefix TEXT NOT NULL,
+    trash_key TEXT,
+    catalog_done INTEGER NOT NULL DEFAULT 0,
+    -- Set when only this replica's copies are reclaimed, never shared storage
+    local_only INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+
+-- Downloads and views of resources, appended in batches (see analytics.py)
+CREATE TABLE IF NOT EXISTS resource_events (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    course_dir TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS resource_events_by_time ON resource_events (created_at);
+
+-- Events per resource and day, updated with every batch
+CREATE TABLE IF NOT EXISTS resource_daily (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    course_dir TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (course_dir, resource_type, name, kind, day)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS resource_daily_by_day ON resource_daily (kind, day);
+
+CREATE TRIGGER IF NOT EXISTS resources_daily_after_rename
+AFTER UPDATE OF course_dir, resource_type, name ON resources BEGIN
+    UPDATE OR IGNORE resource_daily SET course_dir = NEW.course_dir, resource_type = NEW.resource_type, name = NEW.name
+    WHERE course_dir = OLD.course_dir AND resource_type = OLD.resource_type AND name = OLD.name;
+END;
+
+-- Resources catalogued before the search index existed
+INSERT INTO search_documents (course_dir, resource_type, name)
+SELECT course_dir, resource_type, name FROM resources WHERE true
+ON CONFLICT DO NOTHING;
+"""
+
+
+def _stats_rows(row, source=""):
+    """SQL selecting the statistics rows a resource counts towards, with its size.
+
+    These are its course, semester and university (the first three, two and
+    one parts of its course key), each for its resource type and for '*'.
+    `source` is appended to every SELECT, e.g. to read `row` from a table.
+    """
+    course = f"{row}.course_dir"
+    rest = f"substr({course}, instr({course}, '/') + 1)"
+    levels = (
+        (course, 3),
+        (f"substr({course}, 1, instr({course}, '/') + instr({rest}, '/') - 1)", 2),
+        (f"substr({course}, 1, instr({course}, '/') - 1)", 1),
+    )
+    return " UNION ALL ".join(
+        f"SELECT {prefix} AS prefix, {level} AS level, {resource_type} AS resource_type, {row}.size AS size{source}"
+        for prefix, level in levels for resource_type in (f"{row}.resource_type", "'*'")
+    )
+
+
+def _count_stats(row, sign):
+    """Trigger statement adding a resource row to (sign 1) or removing it from (sign -1) the statistics"""
+    return (
+        f"INSERT INTO resource_stats (prefix, level, resource_type, files, bytes) "
+        f"SELECT prefix, level, resource_type, {sign}, {sign} * size FROM ({_stats_rows(row)}) WHERE true "
+        f"ON CONFLICT (prefix, resource_type) DO UPDATE "
+        f"SET files = files + excluded.files, bytes = bytes + excluded.bytes;"
+    )
+
+
+SCHEMA += f"""
+-- File counts and sizes per course, semester and university, for each resource
+-- type and in total ('*'), kept up to date by triggers so reading them is cheap
+CREATE TABLE IF NOT EXISTS resource_stats (
+    prefix TEXT NOT NULL,
+    level INTEGER NOT NULL,  -- 1 university, 2 semester, 3 course
+    resource_type TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    PRIMARY KEY (prefix, resource_type)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS resource_stats_by_size ON resource_stats (level, resource_type, bytes);
+
+CREATE TRIGGER IF NOT EXISTS resources_stats_after_insert AFTER INSERT ON resources BEGIN
+    {_count_stats("NEW", 1)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS resources_stats_after_update
+AFTER UPDATE OF course_dir, resource_type, size ON resources BEGIN
+    {_count_stats("OLD", -1)}
+    {_count_stats("NEW", 1)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS resources_stats_after_delete AFTER DELETE ON resources BEGIN
+    {_count_stats("OLD", -1)}
+END;
+
+-- Resources catalogued before the statistics existed
+INSERT INTO resource_stats (prefix, level, resource_type, files, bytes)
+SELECT prefix, level, resource_type, COUNT(*), SUM(size) FROM ({_stats_rows("r", " FROM resources AS r")})
+WHERE NOT EXISTS (SELECT 1 FROM resource_stats)
+GROUP BY prefix, resource_type;
+"""
+
+# Columns added to existing tables after their first release
+ADDED_COLUMNS = {
+    "resources": {"page_count": "INTEGER", "original_sha256": "TEXT", "text_extracted": "INTEGER NOT NULL DEFAULT 0"},
+    "courses": {"synced_at": "REAL"},
+    "tombstones": {"local_only": "INTEGER NOT NULL DEFAULT 0"},
+}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def get_connection():
+    """Return this thread's connection to the catalog database"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        CATALOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(CATALOG_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Rows replaced by INSERT/UPDATE OR REPLACE must fire the delete triggers too
+        conn.execute("PRAGMA recursive_triggers=ON")
+        with _schema_lock:
+            if not _schema_ready:
+                add_missing_columns(conn)
+                conn.executescript(SCHEMA)
+                _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def add_missing_columns(conn):
+    """Bring tables created by an older release up to the current schema"""
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if not existing:
+            continue  # Created with every column by SCHEMA
+        for column, definition in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def course_key(course_path):
+    """Return the catalog key of a course directory (its path below the uploads dir)"""
+    return Path(course_path).relative_to(UPLOADS_DIR).as_posix()
+
+
+def resource_key(file_path):
+    """Split a resource file path into (course key, resource type, file name)"""
+    file_path = Path(file_path)
+    return course_key(file_path.parent.parent), file_path.parent.name, file_path.name
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Compute the SHA-256 of a file without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _resource_row(file_path, sha256=None, thumbnail_status="none"):
+    """Build the column values describing a file on disk"""
+    stat = os.stat(file_path)
+    course_dir, resource_type, name = resource_key(file_path)
+    mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return (course_dir, resource_type, name, stat.st_size, stat.st_mtime_ns, mime_type,
+            sha256 or file_sha256(file_path), thumbnail_status)
+
+
+def _listed_row(stored):
+    """Build the column values of a resource from its storage listing; its hash is filled in later"""
+    course_dir, resource_type, name = stored.key.rsplit("/", 2)
+    mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return course_dir, resource_type, name, stored.size, stored.mtime_ns, mime_type, None, "none"
+
+
+def _queue_hashing(conn, rows):
+    """Queue a hash_resource job (see jobs.py) for each row catalogued without a hash"""
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO jobs (kind, course_dir, resource_type, name, updated_at) "
+        "SELECT 'hash_resource', ?1, ?2, ?3, ?4 WHERE NOT EXISTS ("
+        "SELECT 1 FROM jobs WHERE kind = 'hash_resource' AND status = 'queued' "
+        "AND course_dir = ?1 AND resource_type = ?2 AND name = ?3)",
+        [(*row[:3], now) for row in rows],
+    )
+
+
+def _insert_rows(conn, rows):
+    conn.executemany(
+        "INSERT OR REPLACE INTO resources "
+        "(course_dir, resource_type, name, size, mtime_ns, mime_type, sha256, thumbnail_status) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def index_course(course_path):
+    """Record the files stored for a course in the catalog.
+
+    A course is scanned once. With storage shared by several replicas it is
+    compared with the storage again every CATALOG_SYNC_INTERVAL seconds, so
+    files uploaded, renamed or deleted by other replicas show up here too.
+    Files found this way are catalogued from the storage listing and hashed
+    by the job queue, so a page run never downloads a whole course.
+    """
+    conn = get_connection()
+    key = course_key(course_path)
+    storage = get_storage()
+    row = conn.execute("SELECT synced_at FROM courses WHERE course_dir = ?", (key,)).fetchone()
+    if row is None:
+        with timed("course_scan_seconds"):
+            rows = [_listed_row(stored) for stored in _stored_resources(storage, key)]
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO courses (course_dir, version, synced_at) VALUES (?, 0, ?)",
+                         (key, time.time()))
+            _insert_rows(conn, rows)
+            _queue_hashing(conn, rows)
+    elif storage.shared:
+        _sync_course(conn, storage, key)
+
+
+def _stored_resources(storage, key):
+    """Yield the StoredObject of every resource file of a course"""
+    for resource_type in RESOURCE_TYPES:
+        for stored in storage.list(f"{key}/{resource_type}"):
+            # Only files directly inside the resource type directory are resources
+            if stored.key.count("/") == key.count("/") + 2:
+                yield stored
+
+
+def _sync_course(conn, storage, key):
+    """Bring a course's catalog entries up to date with shared storage once they are old enough"""
+    now = time.time()
+    with conn:
+        # Claim the sync, so concurrent page runs do not list the same course
+        claimed = conn.execute(
+            "UPDATE courses SET synced_at = ? WHERE course_dir = ? AND coalesce(synced_at, 0) <= ?",
+            (now, key, now - CATALOG_SYNC_INTERVAL),
+        ).rowcount
+    if not claimed:
+        return
+
+    with timed("course_scan_seconds"):
+        # Read the catalog before listing, so a file written here in between is not taken for deleted
+        known = {f"{key}/{row['resource_type']}/{row['name']}": row["size"] for row in conn.execute(
+            "SELECT resource_type, name, size FROM resources WHERE course_dir = ?", (key,))}
+        stored = {obj.key: obj for obj in _stored_resources(storage, key)}
+
+        rows = []
+        # New names, and files replaced by content of another size (such as
+        # re-encoded photos), are hashed again
+        for object_key, obj in stored.items():
+            if known.get(object_key) != obj.size:
+                if object_key in known:
+                    storage.drop_local_copy(object_key)
+                rows.append(_listed_row(obj))
+        removed = [object_key for object_key in known if object_key not in stored]
+        for object_key in removed:
+            storage.drop_local_copy(object_key)
+
+    if rows or removed:
+        with conn:
+            _insert_rows(conn, rows)
+            _queue_hashing(conn, rows)
+            conn.executemany(
+                "DELETE FROM resources WHERE course_dir = ? AND resource_type = ? AND name = ?",
+                [(key, *object_key[len(key) + 1:].split("/")) for object_key in removed],
+            )
+
+
+def is_catalogued(course_path):
+    """Check whether a course has been indexed, without indexing it"""
+    return get_connection().execute(
+        "SELECT 1 FROM courses WHERE course_dir = ?", (course_key(course_path),)
+    ).fetchone() is not None
+
+
+def list_resources(course_path, resource_type, limit=-1, offset=0, index=True):
+    """List the resources of one type for a course, ordered by name.
+
+    `limit` and `offset` select a single page; -1 means no limit. Without
+    `index`, a course that was never indexed has no resources.
+    """
+    if index:
+        index_course(course_path)
+    with timed("catalog_query_seconds", query="list"):
+        return get_connection().execute(
+            "SELECT * FROM resources WHERE course_dir = ? AND resource_type = ? ORDER BY name LIMIT ? OFFSET ?",
+            (course_key(course_path), resource_type, limit, offset),
+        ).fetchall()
+
+
+def count_resources(course_path, resource_type):
+    """Count the resources of one type for a course"""
+    index_course(course_path)
+    with timed("catalog_query_seconds", query="count"):
+        return get_connection().execute(
+            "SELECT COUNT(*) FROM resources WHERE course_dir = ? AND resource_type = ?",
+            (course_key(course_path), resource_type),
+        ).fetchone()[0]
+
+
+def find_resource_by_hash(course_path, resource_type, sha256):
+    """Return the resource of a course with the given content, or re-encoded from it, if any"""
+    index_course(course_path)
+    return get_connection().execute(
+        "SELECT * FROM resources WHERE (sha256 = ? OR original_sha256 = ?) AND course_dir = ? AND resource_type = ?",
+        (sha256, sha256, course_key(course_path), resource_type),
+    ).fetchone()
+
+
+def resources_with_hash(sha256):
+    """Return every catalogued resource with the given content"""
+    return get_connection().execute("SELECT * FROM resources WHERE sha256 = ?", (sha256,)).fetchall()
+
+
+def get_stats(keys):
+    """Return the statistics of course, semester or university keys.
+
+    The result maps each key that has any to {resource type or '*': (files, bytes)}.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    stats = {}
+    rows = get_connection().execute(
+        f"SELECT prefix, resource_type, files, bytes FROM resource_stats WHERE prefix IN ({', '.join('?' * len(keys))})",
+        keys,
+    )
+    for row in rows:
+        stats.setdefault(row["prefix"], {})[row["resource_type"]] = (row["files"], row["bytes"])
+    return stats
+
+
+def largest_courses(limit):
+    """Return the (course key, files, bytes) of the courses taking the most space"""
+    return get_connection().execute(
+        "SELECT prefix, files, bytes FROM resource_stats WHERE level = 3 AND resource_type = '*' AND files > 0 "
+        "ORDER BY bytes DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+# Indexed courses without any resource, checked against their statistics row
+_EMPTY_COURSES = ("FROM courses AS c WHERE NOT EXISTS (SELECT 1 FROM resource_stats AS s "
+                  "WHERE s.prefix = c.course_dir AND s.resource_type = '*' AND s.files > 0)")
+
+
+def count_courses():
+    """Return the number of indexed courses and how many of them hold no resource"""
+    conn = get_connection()
+    return (conn.execute("SELECT COUNT(*) FROM courses").fetchone()[0],
+            conn.execute(f"SELECT COUNT(*) {_EMPTY_COURSES}").fetchone()[0])
+
+
+def empty_course_keys(limit):
+    """Return the keys of up to `limit` indexed courses holding no resource, in key order"""
+    return [row[0] for row in get_connection().execute(
+        f"SELECT course_dir {_EMPTY_COURSES} ORDER BY course_dir LIMIT ?", (limit,))]
+
+
+def get_resource(file_path):
+    """Return the catalog entry of a resource, or None"""
+    return get_connection().execute(
+        "SELECT * FROM resources WHERE course_dir = ? AND resource_type = ? AND name = ?", resource_key(file_path)
+    ).fetchone()
+
+
+def get_course_version(course_path):
+    """Return a number that changes whenever a course's resources change"""
+    row = get_connection().execute(
+        "SELECT version FROM courses WHERE course_dir = ?", (course_key(course_path),)
+    ).fetchone()
+    return row["version"] if row else 0
+
+
+def add_resource(file_path, sha256=None, thumbnail_status="none"):
+    """Record a newly written file in the catalog"""
+    row = _resource_row(file_path, sha256, thumbnail_status)
+    conn = get_connection()
+    with conn:
+        _insert_rows(conn, [row])
+
+
+def add_resources(entries):
+    """Record many new files in one transaction.
+
+    Each entry is a (file path, sha256, thumbnail status) tuple.
+    """
+    rows = [_resource_row(file_path, sha256, thumbnail_status) for file_path, sha256, thumbnail_status in entries]
+    conn = get_connection()
+    with conn:
+        _insert_rows(conn, rows)
+
+
+def remove_resource(file_path):
+    """Forget a deleted file"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM resources WHERE course_dir = ? AND resource_type = ? AND name = ?",
+            resource_key(file_path),
+        )
+
+
+def rename_resource(old_path, new_path):
+    """Update the catalog after a file has been renamed in storage.
+
+    A rename keeps the content and the modification time, so nothing is read
+    from the file, which may not have a local copy with shared storage.
+    """
+    new_course, new_type, new_name = resource_key(new_path)
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE OR REPLACE resources SET course_dir = ?, resource_type = ?, name = ?, mime_type = ? "
+            "WHERE course_dir = ? AND resource_type = ? AND name = ?",
+            (new_course, new_type, new_name, mimetypes.guess_type(new_name)[0] or "application/octet-stream",
+             *resource_key(old_path)),
+        )
+
+
+def replace_resource(old_path, new_path, sha256):
+    """Update the catalog after a file's content was replaced, possibly under a new name.
+
+    The hash of the content it replaced is kept so uploading that again is
+    still recognised as a duplicate.
+    """
+    # Every column but the thumbnail status, which the caller updates once a preview exists
+    row = _resource_row(new_path, sha256)[:7]
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE OR REPLACE resources SET course_dir = ?, resource_type = ?, name = ?, size = ?, mtime_ns = ?, "
+            # Expressions see the row as it was, so this keeps the hash of the first upload
+            "mime_type = ?, sha256 = ?, original_sha256 = coalesce(original_sha256, sha256) "
+            "WHERE course_dir = ? AND resource_type = ? AND name = ?",
+            (*row, *resource_key(old_path)),
+        )
+
+
+def set_resource_hash(file_path, sha256):
+    """Record the hash of a resource catalogued from a storage listing.
+
+    The size and modification time are those of the local copy that was
+    hashed, which the file server checks before serving it as a blob.
+    """
+    stat = os.stat(file_path)
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE resources SET sha256 = ?, size = ?, mtime_ns = ? "
+            "WHERE course_dir = ? AND resource_type = ? AND name = ?",
+            (sha256, stat.st_size, stat.st_mtime_ns, *resource_key(file_path)),
+        )
+
+
+def set_thumbnail_status(file_path, status):
+    """Record whether a preview exists for a resource.
+
+    Nothing is written when the status is unchanged, since every write bumps
+    the course version and so drops its rendered cards and bundles.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE resources SET thumbnail_status = ? "
+            "WHERE course_dir = ? AND resource_type = ? AND name = ? AND thumbnail_status != ?",
+            (status, *resource_key(file_path), status),
+        )
+
+
+def set_text_extracted(file_path, page_count=None):
+    """Record that the text of a resource was extracted, and the number of pages found if known"""
+    conn = get_connection()
+    with conn:
+        # page_count is only assigned when known, since assigning it bumps the course version
+        if page_count is None:
+            conn.execute(
+                "UPDATE resources SET text_extracted = 1 WHERE course_dir = ? AND resource_type = ? AND name = ?",
+                resource_key(file_path),
+            )
+        else:
+            conn.execute(
+                "UPDATE resources SET text_extracted = 1, page_count = ? "
+                "WHERE course_dir = ? AND resource_type = ? AND name = ?",
+                (page_count, *resource_key(file_path)),
+            )
@@ -0,0 +1,309 @@
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+
+from bundles import remove_bundles
+from catalog import get_connection
+from config import BLOBS_DIR, GC_BATCH_SIZE, IMAGE_KEEP_ORIGINAL, RECONCILE_INTERVAL, UPLOADS_DIR
+from metrics import increment
+from storage import LocalStorage, get_storage, storage_key
+from thumbnails import thumbnail_key, thumbnail_path_for_key
+
+logger = logging.getLogger(__name__)
+
+# Storage prefix under which deleted directories wait to be reclaimed
+TRASH_PREFIX = ".trash"
+
+# Orphans younger than this many seconds are left alone: they may belong to a change in progress
+ORPHAN_GRACE = 3600
+
+# Seconds between checks for deletions recorded by other processes
+POLL_INTERVAL = 5.0
+
+# Set when a deletion is recorded by this process so the collector wakes up at once
+_wakeup = threading.Event()
+
+# Serializes the batches of the collector thread with deletions finished on request
+_collect_lock = threading.Lock()
+
+
+def _under(column):
+    """SQL condition matching a key column equal to or below the prefix passed as `_prefix_params`"""
+    return f"({column} = ? OR ({column} > ? AND {column} < ?))"
+
+
+def _prefix_params(prefix):
+    # "0" sorts right after "/", so the range holds exactly the keys below the prefix
+    return prefix, prefix + "/", prefix + "0"
+
+
+def files_storage(local_only):
+    """Return the storage a deletion reclaims files from"""
+    storage = get_storage()
+    # Shared storage keeps this replica's copies in the uploads directory
+    return LocalStorage(UPLOADS_DIR) if local_only and storage.shared else storage
+
+
+def delete_later(path, local_only=False):
+    """Soft-delete a university, semester or course directory.
+
+    On local storage the directory is moved into the trash at once, so a
+    new directory of the same name never mixes with it. A tombstone records
+    the deletion; the collector thread then reclaims the files, previews,
+    bundles and catalog entries in batches. With `local_only`, shared
+    storage is left alone and only this replica's copies and catalog
+    entries are reclaimed.
+    """
+    prefix = storage_key(path)
+    trash_key = f"{TRASH_PREFIX}/{uuid.uuid4().hex}"
+    if not files_storage(local_only).move_prefix(prefix, trash_key):
+        trash_key = None  # The objects are deleted where they are
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO tombstones (prefix, trash_key, local_only, created_at) VALUES (?, ?, ?, ?)",
+            (prefix, trash_key, int(local_only), time.time()),
+        )
+    _wakeup.set()
+
+
+def pending_deletion_count():
+    """Count the deletions that are still being reclaimed"""
+    return get_connection().execute("SELECT COUNT(*) FROM tombstones").fetchone()[0]
+
+
+def purge_catalog_batch(tombstone):
+    """Forget up to GC_BATCH_SIZE catalog entries below a tombstone; return how many were removed"""
+    conn = get_connection()
+    with conn:
+        # Checked in the same statement: once a deletion has been finished on request,
+        # entries of the directory created again must survive
+        rows = conn.execute(
+            "DELETE FROM resources WHERE (course_dir, resource_type, name) IN ("
+            "SELECT course_dir, resource_type, name FROM resources "
+            f"WHERE {_under('course_dir')} AND EXISTS (SELECT 1 FROM tombstones WHERE id = ? AND NOT catalog_done) "
+            "LIMIT ?) RETURNING course_dir, resource_type, name, mtime_ns, size",
+            (*_prefix_params(tombstone["prefix"]), tombstone["id"], GC_BATCH_SIZE),
+        ).fetchall()
+
+    for row in rows:
+        file_path = UPLOADS_DIR / row["course_dir"] / row["resource_type"] / row["name"]
+        try:
+            os.remove(thumbnail_path_for_key(thumbnail_key(file_path, row["mtime_ns"], row["size"])))
+        except FileNotFoundError:
+            pass
+    for course_dir in {row["course_dir"] for row in rows}:
+        remove_bundles(UPLOADS_DIR / course_dir)
+    increment("gc_catalog_entries_total", len(rows))
+    return len(rows)
+
+
+def finish_catalog(tombstone):
+    """Forget the courses below a tombstone once their resources are gone"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            f"DELETE FROM courses WHERE {_under('course_dir')} "
+            "AND EXISTS (SELECT 1 FROM tombstones WHERE id = ? AND NOT catalog_done)",
+            (*_prefix_params(tombstone["prefix"]), tombstone["id"]),
+        )
+        conn.execute("UPDATE tombstones SET catalog_done = 1 WHERE id = ?", (tombstone["id"],))
+
+
+def purge_files_batch(tombstone):
+    """Delete up to GC_BATCH_SIZE stored files of a tombstone; return how many were deleted"""
+    storage = files_storage(tombstone["local_only"])
+    prefix = tombstone["trash_key"] or tombstone["prefix"]
+    keys = [stored.key for stored in itertools.islice(storage.list(prefix), GC_BATCH_SIZE)]
+    for key in keys:
+        storage.delete(key)
+    if not keys:
+        storage.delete_prefix(prefix)  # The directories left empty
+    increment("gc_files_total", len(keys))
+    return len(keys)
+
+
+def collect_step(tombstone_id, files=True):
+    """Reclaim one batch of a deletion (caller holds _collect_lock); return False once it is complete.
+
+    Without `files`, the deletion counts as complete once its catalog entries are gone.
+    """
+    conn = get_connection()
+    tombstone = conn.execute("SELECT * FROM tombstones WHERE id = ?", (tombstone_id,)).fetchone()
+    if tombstone is None:
+        return False
+    if not tombstone["catalog_done"]:
+        if not purge_catalog_batch(tombstone):
+            finish_catalog(tombstone)
+        return True
+    if not files:
+        return False
+    if purge_files_batch(tombstone):
+        return True
+    with conn:
+        conn.execute("DELETE FROM tombstones WHERE id = ?", (tombstone_id,))
+    increment("gc_deletions_total")
+    return False
+
+
+def collect_pending():
+    """Reclaim one batch of every pending deletion; return whether anything was left to do"""
+    tombstone_ids = [row["id"] for row in get_connection().execute("SELECT id FROM tombstones ORDER BY id")]
+    busy = False
+    for tombstone_id in tombstone_ids:
+        with _collect_lock:
+            busy = collect_step(tombstone_id) or busy
+    return busy
+
+
+def finish_deletions(path):
+    """Finish right away the deletions that overlap a directory about to be created again.
+
+    Their catalog entries are removed now so the new directory starts out
+    empty. Files are removed too unless they were moved to the trash, where
+    they cannot clash with the new directory.
+    """
+    prefix = storage_key(path)
+    for tombstone in get_connection().execute("SELECT * FROM tombstones ORDER BY id").fetchall():
+        if tombstone["prefix"] in (prefix, *ancestor_keys(prefix)) or tombstone["prefix"].startswith(prefix + "/"):
+            with _collect_lock:
+                while collect_step(tombstone["id"], files=tombstone["trash_key"] is None):
+                    pass
+
+
+def ancestor_keys(key):
+    """Return the keys of the directories containing a key, e.g. "U/S" for "U/S/C" """
+    parts = key.split("/")
+    return ["/".join(parts[:depth]) for depth in range(1, len(parts))]
+
+
+def reconcile(live_keys):
+    """Delete what the hierarchy can no longer reach.
+
+    `live_keys` holds the storage key of every university, semester and
+    course. Upload directories and catalogued courses outside it are
+    soft-deleted, trash left behind by an interrupted deletion is removed,
+    and blobs no upload links to any more are reclaimed, except the uploads
+    of re-encoded photos when IMAGE_KEEP_ORIGINAL is set.
+
+    Everything here is found in this replica's own directories, catalog and
+    settings, so with shared storage only the local copies are reclaimed:
+    other replicas may still show those courses.
+    """
+    conn = get_connection()
+    pending = {row["prefix"] for row in conn.execute("SELECT prefix FROM tombstones")}
+    cutoff = time.time() - ORPHAN_GRACE
+
+    def is_orphan(key):
+        ancestors = ancestor_keys(key)
+        # Anything below a live course (e.g. its resource type directories) belongs to that course
+        if any(ancestor in live_keys for ancestor in ancestors[2:]):
+            return False
+        return key not in live_keys and key not in pending and not any(ancestor in pending for ancestor in ancestors)
+
+    def last_change(course_dir):
+        """Newest modification time of a course directory or of any file catalogued for it"""
+        try:
+            newest = (UPLOADS_DIR / course_dir).stat().st_mtime
+        except FileNotFoundError:
+            newest = 0
+        mtime_ns = conn.execute("SELECT max(mtime_ns) FROM resources WHERE course_dir = ?", (course_dir,)).fetchone()[0]
+        return max(newest, (mtime_ns or 0) / 1e9)
+
+    # Upload directories of removed universities, semesters and courses
+    def scan(directory, key_prefix, depth):
+        for entry in os.scandir(directory):
+            if not entry.is_dir() or entry.name == TRASH_PREFIX:
+                continue
+            key = key_prefix + entry.name
+            if is_orphan(key):
+                if entry.stat().st_mtime < cutoff:
+                    delete_later(UPLOADS_DIR / key, local_only=True)
+                    increment("gc_orphans_total", kind="directory")
+            elif depth < 3:
+                scan(entry.path, key + "/", depth + 1)
+
+    if UPLOADS_DIR.is_dir():
+        scan(UPLOADS_DIR, "", 1)
+
+    # Catalog keys that are not university/semester/course triples were recorded by mistake
+    # (e.g. for a resource type directory); only their catalog entries are dropped, never files
+    with conn:
+        for table in ("resources", "courses"):
+            conn.execute(f"DELETE FROM {table} WHERE course_dir NOT GLOB '*/*/*' OR course_dir GLOB '*/*/*/*'")
+
+    # Catalogued courses the hierarchy no longer has; recent ones may belong to a change in progress
+    for row in conn.execute("SELECT course_dir FROM courses").fetchall():
+        course_dir = row["course_dir"]
+        if is_orphan(course_dir) and last_change(course_dir) < cutoff:
+            delete_later(UPLOADS_DIR / course_dir, local_only=True)
+            increment("gc_orphans_total", kind="catalog")
+
+    # Trash of deletions interrupted before their tombstone was written (read again to
+    # include the deletions recorded above)
+    trash_keys = {row["trash_key"] for row in conn.execute("SELECT trash_key FROM tombstones")}
+    trash_dir = UPLOADS_DIR / TRASH_PREFIX
+    if trash_dir.is_dir():
+        for entry in os.scandir(trash_dir):
+            key = f"{TRASH_PREFIX}/{entry.name}"
+            if key not in trash_keys and entry.stat().st_mtime < cutoff:
+                files_storage(local_only=True).delete_prefix(key)
+                increment("gc_orphans_total", kind="trash")
+
+    # Blobs that no upload links to any more, and temporary files of aborted uploads. The inode
+    # change time of a blob moves whenever it is linked, unlinked or about to be reused.
+    originals = set()
+    if IMAGE_KEEP_ORIGINAL:
+        originals = {row[0] for row in conn.execute(
+            "SELECT original_sha256 FROM resources WHERE original_sha256 IS NOT NULL")}
+    if BLOBS_DIR.is_dir():
+        for directory in os.scandir(BLOBS_DIR):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                    unused = directory.name == "tmp" or (
+                        stat.st_nlink == 1 and directory.name + entry.name not in originals)
+                    if entry.is_file() and unused and max(stat.st_mtime, stat.st_ctime) < cutoff:
+                        os.remove(entry.path)
+                        increment("gc_orphans_total", kind="blob")
+                except FileNotFoundError:
+                    continue
+
+
+class GarbageCollector:
+    """Reclaims deleted directories in the background and periodically looks for orphans.
+
+    `live_keys` is called before every reconciliation and returns the
+    storage keys of every university, semester and course.
+    """
+
+    def __init__(self, live_keys):
+        self.live_keys = live_keys
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="garbage-collector", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        # Look for orphans left by earlier releases soon after starting
+        next_reconcile = time.monotonic() + 60
+        while True:
+            try:
+                busy = collect_pending()
+                if time.monotonic() >= next_reconcile:
+                    reconcile(self.live_keys())
+                    next_reconcile = time.monotonic() + RECONCILE_INTERVAL
+                if not busy:
+                    _wakeup.wait(POLL_INTERVAL)
+                    _wakeup.clear()
+            except Exception:
+                # Keep collecting; one failing deletion must not stop the others
+                logger.exception("Garbage collection failed")
+                time.sleep(POLL_INTERVAL)
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+
+# Data locations
+DATA_DIR = Path("data")
+UPLOADS_DIR = DATA_DIR / "uploads"
+SETTINGS_PATH = DATA_DIR / "settings.json"
+
+# Companion file server that streams resources to the browser.
+# RESOURCE_SERVER_URL should be set when the portal sits behind a proxy;
+# otherwise links are built from the host the student connected to.
+RESOURCE_SERVER_HOST = os.environ.get("RESOURCE_SERVER_HOST", "0.0.0.0")
+RESOURCE_SERVER_PORT = int(os.environ.get("RESOURCE_SERVER_PORT", "5001"))
+RESOURCE_SERVER_URL = os.environ.get("RESOURCE_SERVER_URL", "").rstrip("/")
+
+# Thumbnail previews shown in the resource cards
+THUMBNAIL_DIR = DATA_DIR / "cache" / "thumbnails"
+THUMBNAIL_MAX_SIZE = (200, 200)
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("THUMBNAIL_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# SQLite catalog of uploaded resources
+CATALOG_PATH = DATA_DIR / "catalog.db"
+
+# Content-addressed store holding one copy of every uploaded file
+BLOBS_DIR = DATA_DIR / "blobs"
+INGEST_CHUNK_SIZE = 1024 * 1024
+
+# Worker threads used to ingest bulk uploads and archive imports
+BULK_IMPORT_WORKERS = int(os.environ.get("BULK_IMPORT_WORKERS", min(8, os.cpu_count() or 1)))
+
+# Number of resource cards shown per gallery page
+GALLERY_PAGE_SIZE = int(os.environ.get("GALLERY_PAGE_SIZE", "24"))
+
+# Universities, semesters or courses listed in a selector before it asks for a
+# type-ahead filter instead
+SELECTOR_LIMIT = int(os.environ.get("SELECTOR_LIMIT", "50"))
+
+# Course resource types whose rendered gallery pages are kept in memory
+CARD_CACHE_ENTRIES = int(os.environ.get("CARD_CACHE_ENTRIES", "256"))
+
+# Worker processes running background jobs such as text extraction and OCR
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(1, min(4, (os.cpu_count() or 1) // 2))))
+
+# With IMAGE_OPTIMIZE set to "webp" or "jpeg", uploaded photos are re-encoded in
+# the background without their metadata and scaled down to IMAGE_MAX_DIMENSION
+# pixels on their longest side. Off by default, since it replaces what was
+# uploaded; the upload as sent stays in the blob store unless IMAGE_KEEP_ORIGINAL=0
+IMAGE_OPTIMIZE = os.environ.get("IMAGE_OPTIMIZE", "off").lower()
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "80"))
+IMAGE_KEEP_ORIGINAL = os.environ.get("IMAGE_KEEP_ORIGINAL", "1") == "1"
+
+# Downloads and gallery views are buffered in memory and written to the catalog
+# every ANALYTICS_FLUSH_INTERVAL seconds; raw events older than
+# ANALYTICS_RETENTION_DAYS are dropped, daily totals are kept
+ANALYTICS_FLUSH_INTERVAL = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", "5"))
+ANALYTICS_BUFFER_SIZE = int(os.environ.get("ANALYTICS_BUFFER_SIZE", "100000"))
+ANALYTICS_RETENTION_DAYS = int(os.environ.get("ANALYTICS_RETENTION_DAYS", "90"))
+
+# Deleted universities, semesters and courses are reclaimed in the background,
+# GC_BATCH_SIZE files or catalog entries at a time; every RECONCILE_INTERVAL
+# uploads, catalog entries and blobs no longer reachable are collected too
+GC_BATCH_SIZE = int(os.environ.get("GC_BATCH_SIZE", "500"))
+RECONCILE_INTERVAL = float(os.environ.get("RECONCILE_INTERVAL_HOURS", "6")) * 3600
+
+# Memory budget for the contents of frequently downloaded files kept by the
+# file server; files over BYTE_CACHE_MAX_FILE_MB are always read from disk
+BYTE_CACHE_MAX_BYTES = int(os.environ.get("BYTE_CACHE_MAX_MB", "256")) * 1024 * 1024
+BYTE_CACHE_MAX_FILE_BYTES = int(os.environ.get("BYTE_CACHE_MAX_FILE_MB", "8")) * 1024 * 1024
+
+# ZIP bundles of whole courses or resource types offered as "Download all"
+BUNDLE_DIR = DATA_DIR / "cache" / "bundles"
+BUNDLE_CACHE_MAX_BYTES = int(os.environ.get("BUNDLE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# Where uploaded resources are stored: "local" (the uploads directory) or "s3"
+# (an S3-compatible bucket such as MinIO, shared by every portal replica;
+# credentials come from the standard AWS_* environment variables)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local").lower()
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")
+
+# With shared storage, a course's catalog entries are compared with the bucket
+# again when they are older than CATALOG_SYNC_INTERVAL seconds, so uploads,
+# renames and deletions made on other replicas show up
+CATALOG_SYNC_INTERVAL = float(os.environ.get("CATALOG_SYNC_INTERVAL", "60"))
+
+# Write one JSON line with the timings of every page run to stderr
+METRICS_LOG = os.environ.get("METRICS_LOG", "0") == "1"
+
+# Bearer token required for the file server's /metrics; without one, only
+# clients on this machine may read it
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
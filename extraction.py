@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from thumbnails import is_image
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF text is only extracted when pypdf is installed
+    PdfReader = None
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # Images are only OCRed when pytesseract is installed
+    pytesseract = None
+
+# Plain-text resources whose content is indexed as-is
+TEXT_EXTENSIONS = {".txt", ".md", ".csv"}
+
+# Upper bound on the text kept per resource
+MAX_TEXT_CHARS = 200_000
+
+
+def can_extract(file_name):
+    """Whether text can be extracted from a file with this name"""
+    extension = Path(file_name).suffix.lower()
+    return (extension in TEXT_EXTENSIONS
+            or (extension == ".pdf" and PdfReader is not None)
+            or (is_image(file_name) and pytesseract is not None))
+
+
+def extract_pdf(file_path):
+    """Return the text layer and page count of a PDF"""
+    reader = PdfReader(file_path)
+    text = []
+    length = 0
+    for page in reader.pages:
+        if length >= MAX_TEXT_CHARS:
+            break
+        page_text = page.extract_text() or ""
+        text.append(page_text)
+        length += len(page_text)
+    return "\n".join(text)[:MAX_TEXT_CHARS], len(reader.pages)
+
+
+def extract_text(file_path):
+    """Return (text, page count) of a resource.
+
+    Runs in a worker process, so it must only depend on its argument.
+    The page count is None for formats without pages.
+    """
+    extension = Path(file_path).suffix.lower()
+    if extension in TEXT_EXTENSIONS:
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read(MAX_TEXT_CHARS), None
+    if extension == ".pdf" and PdfReader is not None:
+        return extract_pdf(file_path)
+    if is_image(file_path) and pytesseract is not None:
+        # Photos of exams and handwritten notes are read with local OCR
+        with Image.open(file_path) as image:
+            return pytesseract.image_to_string(image)[:MAX_TEXT_CHARS], 1
+    return "", None
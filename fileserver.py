@@ -0,0 +1,375 @@
+import hmac
+import logging
+import mimetypes
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+from config import METRICS_TOKEN, UPLOADS_DIR
+from analytics import DOWNLOAD, record_event
+from bundles import ALL_TYPES, bundle_entries, cached_bundle, stream_bundle
+from bytecache import get_bytes
+from catalog import RESOURCE_TYPES, is_catalogued, resources_with_hash, set_thumbnail_status
+from metrics import increment, render_prometheus, timed
+from storage import get_storage
+from thumbnails import get_thumbnail
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks streamed to the client, so memory use per download stays flat
+CHUNK_SIZE = 64 * 1024
+
+# First path components counted as separate routes in the request metrics
+ROUTES = ("files", "blobs", "thumbnails", "bundles", "metrics")
+
+# Blob and thumbnail URLs embed the content hash or file version, so their content never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Plain file URLs keep serving whatever the file holds now, so caches must check back first
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+def catalog_path(file_path):
+    """Turn a resolved file path into the relative form the catalog keys resources by"""
+    return UPLOADS_DIR / Path(file_path).relative_to(UPLOADS_DIR.resolve())
+
+
+def resource_path_to_url_path(file_path):
+    """Return the server path under which an uploaded file is served"""
+    relative = Path(file_path).resolve().relative_to(UPLOADS_DIR.resolve())
+    return "/files/" + quote(relative.as_posix())
+
+
+def blob_url_path(sha256, file_name):
+    """Return the content-addressed server path of an uploaded file.
+
+    The path names the file's SHA-256, so what it serves never changes and
+    browsers and proxies may cache it for good. The file name only sets the
+    name of the download.
+    """
+    return f"/blobs/{sha256}/{quote(file_name)}"
+
+
+def thumbnail_url_path(file_path, version):
+    """Return the server path of an uploaded image's preview.
+
+    The version (derived from mtime and size) makes the URL change whenever
+    the image does, so browsers can cache previews indefinitely.
+    """
+    relative = Path(file_path).resolve().relative_to(UPLOADS_DIR.resolve())
+    return "/thumbnails/" + quote(relative.as_posix()) + f"?v={version}"
+
+
+def bundle_url_path(course_path, resource_type=ALL_TYPES):
+    """Return the server path of the ZIP of a course's resources of one type (or all)"""
+    relative = Path(course_path).resolve().relative_to(UPLOADS_DIR.resolve())
+    return "/bundles/" + quote(relative.as_posix()) + f"/{resource_type}.zip"
+
+
+def parse_range(range_header, file_size):
+    """Parse a single-range Range header into an inclusive (start, end) tuple.
+
+    Returns None when the header should be ignored and the whole file sent,
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        # Multiple ranges are rarely used by browsers; serve the full file instead
+        return None
+
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            start = max(file_size - length, 0)
+            end = file_size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+            end = min(end, file_size - 1)
+    except ValueError:
+        raise ValueError(f"Invalid range: {range_header}")
+
+    if start >= file_size or start > end:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    return start, end
+
+
+class ResourceRequestHandler(BaseHTTPRequestHandler):
+    """Serve uploaded resources with Range, ETag and Last-Modified support"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "StudentResourcePortal"
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def handle_request(self, send_body):
+        path = unquote(urlsplit(self.path).path)
+        route = path.split("/")[1] if path.count("/") > 1 or path == "/metrics" else ""
+        route = route if route in ROUTES else "other"
+        self.status = None
+        self.bytes_sent = 0
+        with timed("file_request_seconds", route=route):
+            self.route_request(path, send_body)
+        increment("file_requests_total", route=route, status=self.status)
+        if self.bytes_sent:
+            increment("bytes_sent_total", self.bytes_sent, route=route)
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
+    def may_read_metrics(self):
+        """Check whether the client may read /metrics: with the token, or from this machine when none is set"""
+        if METRICS_TOKEN:
+            return hmac.compare_digest(self.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode())
+        return self.client_address[0] in ("127.0.0.1", "::1")
+
+    def route_request(self, path, send_body):
+        if path == "/metrics":
+            if not self.may_read_metrics():
+                self.send_error(403)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+                self.bytes_sent += len(body)
+        elif path.startswith("/files/"):
+            file_path = self.resolve_upload(path[len("/files/"):])
+            if file_path is None:
+                self.send_error(404)
+                return
+            self.send_file(file_path, send_body, attachment=True,
+                           extra_headers={"Cache-Control": REVALIDATE_CACHE_CONTROL})
+            self.record_download(file_path, send_body)
+        elif path.startswith("/blobs/"):
+            sha256, _, file_name = path[len("/blobs/"):].partition("/")
+            file_path = self.resolve_blob(sha256.lower(), file_name)
+            if file_path is None:
+                self.send_error(404)
+                return
+            # The hash is a strong validator: equal tags mean byte-identical content
+            self.send_file(file_path, send_body, attachment=True, download_name=file_name or file_path.name,
+                           etag=f'"{sha256.lower()}"', extra_headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+            self.record_download(file_path, send_body)
+        elif path.startswith("/thumbnails/"):
+            file_path = self.resolve_upload(path[len("/thumbnails/"):])
+            # Previews are generated on demand if they were never built or got evicted
+            if file_path is None:
+                self.send_error(404)
+                return
+            thumbnail_path = get_thumbnail(file_path)
+            if thumbnail_path is None:
+                # Stop the portal from asking for a preview of an unreadable image again
+                set_thumbnail_status(catalog_path(file_path), "failed")
+                self.send_error(404)
+                return
+            self.send_file(thumbnail_path, send_body,
+                           extra_headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+        elif path.startswith("/bundles/") and path.endswith(".zip"):
+            relative_course, _, resource_type = path[len("/bundles/"):-len(".zip")].rpartition("/")
+            course_path = self.resolve_course(relative_course)
+            if course_path is None or resource_type not in RESOURCE_TYPES + (ALL_TYPES,):
+                self.send_error(404)
+                return
+            download_name = f"{course_path.name}-{resource_type}.zip"
+            bundle_path = cached_bundle(course_path, resource_type)
+            if bundle_path is not None:
+                self.send_file(bundle_path, send_body, attachment=True, download_name=download_name)
+                return
+            entries = bundle_entries(course_path, resource_type)
+            if not entries:
+                self.send_error(404)
+                return
+            self.send_bundle(course_path, resource_type, entries, send_body, download_name)
+        else:
+            self.send_error(404)
+
+    def resolve_course(self, relative_path):
+        """Map a request path onto a catalogued university/semester/course directory.
+
+        Returns the course path in the catalog's relative form, or None.
+        """
+        parts = relative_path.split("/")
+        if len(parts) != 3 or any(part in ("", ".", "..") for part in parts):
+            return None
+        course_path = UPLOADS_DIR.joinpath(*parts)
+        return course_path if is_catalogued(course_path) else None
+
+    def resolve_upload(self, relative_path):
+        """Map a request path onto a file inside the uploads directory"""
+        root = UPLOADS_DIR.resolve()
+        file_path = (root / relative_path).resolve()
+        # Refuse anything that escapes the uploads directory (e.g. "../settings.json")
+        if root not in file_path.parents:
+            return None
+        if not file_path.is_file():
+            # With shared storage the file may only exist on another replica so far
+            try:
+                get_storage().local_path(file_path.relative_to(root).as_posix())
+            except FileNotFoundError:
+                return None
+        return file_path if file_path.is_file() else None
+
+    def record_download(self, file_path, send_body):
+        """Count a download of an uploaded file once its content was sent"""
+        # Later parts of a resumed download and revalidations answered with 304 are not counted again
+        first_part = self.status == 200 or (self.status == 206 and self.headers.get("Range", "").startswith("bytes=0-"))
+        if send_body and first_part:
+            record_event(DOWNLOAD, catalog_path(file_path))
+
+    def resolve_blob(self, sha256, file_name):
+        """Find a file whose content has the given hash, preferring one with the requested name"""
+        if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+            return None
+        rows = sorted(resources_with_hash(sha256), key=lambda row: row["name"] != file_name)
+        for row in rows:
+            file_path = self.resolve_upload(f"{row['course_dir']}/{row['resource_type']}/{row['name']}")
+            if file_path is None:
+                continue
+            # Only a file unchanged since it was hashed may be served under the hash
+            stat = os.stat(file_path)
+            if stat.st_size == row["size"] and stat.st_mtime_ns == row["mtime_ns"]:
+                return file_path
+        return None
+
+    def send_file(self, file_path, send_body, attachment=False, extra_headers=None, download_name=None, etag=None):
+        """Stream a file to the client, honouring conditional and range requests.
+
+        The ETag defaults to one derived from the file's mtime and size.
+        """
+        stat = os.stat(file_path)
+        file_size = stat.st_size
+        etag = etag or f'"{stat.st_mtime_ns:x}-{file_size:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+        if self.is_not_modified(etag, stat.st_mtime):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        byte_range = None
+        if_range = self.headers.get("If-Range")
+        if if_range is None or if_range == etag or if_range == last_modified:
+            try:
+                byte_range = parse_range(self.headers.get("Range"), file_size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{file_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        if byte_range is None:
+            start, end = 0, file_size - 1
+            self.send_response(200)
+        else:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+
+        content_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(max(end - start + 1, 0)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        if attachment:
+            self.send_header("Content-Disposition",
+                             f"attachment; filename*=UTF-8''{quote(download_name or file_path.name)}")
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if send_body and file_size:
+            # Hot files are served from memory
+            content = get_bytes(file_path, stat)
+            if content is None:
+                self.copy_range(file_path, start, end)
+            else:
+                self.write_range(content, start, end)
+
+    def send_bundle(self, course_path, resource_type, entries, send_body, download_name):
+        """Stream a bundle to the client while it is built; its size is unknown, so the connection closes after it"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(download_name)}")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        if send_body:
+            def write(data):
+                self.wfile.write(data)
+                self.bytes_sent += len(data)
+            stream_bundle(course_path, resource_type, entries, write)
+
+    def write_range(self, content, start, end):
+        """Write bytes start..end (inclusive) of a file's cached content to the socket in chunks"""
+        view = memoryview(content)
+        for offset in range(start, end + 1, CHUNK_SIZE):
+            chunk = view[offset:min(offset + CHUNK_SIZE, end + 1)]
+            self.wfile.write(chunk)
+            self.bytes_sent += len(chunk)
+
+    def copy_range(self, file_path, start, end):
+        """Write bytes start..end (inclusive) of a file to the socket in chunks"""
+        remaining = end - start + 1
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                self.bytes_sent += len(chunk)
+                remaining -= len(chunk)
+
+    def is_not_modified(self, etag, mtime):
+        """Check the conditional request headers against the current file version"""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return etag in tags or "*" in tags
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def start_file_server(host, port):
+    """Start the resource file server on a daemon thread and return it"""
+    server = ThreadingHTTPServer((host, port), ResourceRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="resource-file-server", daemon=True)
+    thread.start()
+    logger.info("Resource file server listening on %s:%s", host, port)
+    return server
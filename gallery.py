@@ -0,0 +1,244 @@
+import html
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import streamlit as st
+
+from analytics import VIEW, record_events
+from catalog import count_resources, course_key, get_course_version, get_resource, index_course, list_resources, rename_resource
+from config import CARD_CACHE_ENTRIES, GALLERY_PAGE_SIZE
+from metrics import increment, timed
+from search import search_resources
+from storage import get_storage, storage_key
+from thumbnails import is_image, is_pdf, move_thumbnail, thumbnail_key
+from utils import get_bundle_url, get_resource_server_base_url, get_resource_url, get_thumbnail_url, rerun_fragment
+
+# Tab label -> (resource directory, message shown when it is empty)
+RESOURCE_TABS = {
+    "Past Exams": ("exams", "No exams found for this selection."),
+    "Study Sheets": ("sheets", "No study sheets found for this selection."),
+    "Tips & Guides": ("tips", "No tips or guides found for this selection."),
+}
+
+# (course directory, resource type, file server base URL) -> rendered gallery of that catalog
+# version, least recently used first
+_card_cache = OrderedDict()
+_card_cache_lock = threading.Lock()
+
+def short_file_name(file_name):
+    """Truncate a file name for display, keeping its extension"""
+    if len(file_name) > 20:
+        name_parts = os.path.splitext(file_name)
+        return name_parts[0][:17] + "..." + name_parts[1]
+    return file_name
+
+def file_download_link(file_path, file_name, file_size, sha256=None):
+    """Generate a download link for a file served by the resource file server"""
+    file_size = file_size / 1024  # Size in KB
+    return f'<a href="{get_resource_url(file_path, sha256)}" download="{html.escape(file_name)}" class="download-btn">Download ({file_size:.1f} KB)</a>'
+
+def file_card_html(file_path, resource, caption=None):
+    """Build the HTML card showing one resource, optionally with a caption under its name"""
+    file_name = resource["name"]
+    file_date = datetime.fromtimestamp(resource["mtime_ns"] / 1e9).strftime('%Y-%m-%d')
+
+    # Create a file card with HTML for better layout control
+    file_html = '<div class="file-card">'
+
+    # Add thumbnail container
+    file_html += '<div class="thumbnail-container">'
+    if is_image(file_name) and resource["thumbnail_status"] != "failed":
+        # For images, show a small cached preview instead of the original
+        thumbnail_url = get_thumbnail_url(file_path, resource["mtime_ns"], resource["size"])
+        file_html += f'<img src="{thumbnail_url}" style="max-width:100%; max-height:100px;" />'
+    elif is_pdf(file_name) and resource["thumbnail_status"] == "ready":
+        # For PDFs, show their first page once its preview has been rendered
+        thumbnail_url = get_thumbnail_url(file_path, resource["mtime_ns"], resource["size"])
+        file_html += f'<img src="{thumbnail_url}" style="max-width:100%; max-height:100px;" />'
+    elif is_pdf(file_name):
+        # For PDFs, show a PDF icon
+        file_html += '<div class="file-icon">📄</div>'
+    else:
+        # For other files show a generic file icon
+        file_html += '<div class="file-icon">📁</div>'
+    file_html += '</div>'
+
+    # Add file name (shortened if needed), download button and upload date
+    file_html += f'<div class="file-name">{html.escape(short_file_name(file_name))}</div>'
+    if caption:
+        file_html += f'<div style="font-size:0.8rem; text-align:center; margin-bottom:0.5rem;">{caption}</div>'
+    file_html += file_download_link(file_path, file_name, resource["size"], resource["sha256"])
+    pages = f" · {resource['page_count']} pages" if resource["page_count"] and resource["page_count"] > 1 else ""
+    file_html += f'<div style="font-size:0.8rem; text-align:center; margin-top:0.5rem;">Uploaded: {file_date}{pages}</div>'
+
+    # Close file card
+    file_html += '</div>'
+    return file_html
+
+def bundle_download_link(course_path, resource_type, label):
+    """Generate a link downloading a ZIP of a course's resources"""
+    return f'<a href="{get_bundle_url(course_path, resource_type)}" download class="download-btn">{label}</a>'
+
+def render_cards(cards):
+    """Emit a block of file cards, counting the HTML sent to the browser"""
+    cards_html = f'<div class="file-container">{cards}</div>'
+    increment("page_html_bytes_total", len(cards_html.encode()))
+    st.markdown(cards_html, unsafe_allow_html=True)
+
+def render_rename_controls(resource_dir, resource_type, file_name):
+    """Show the admin Rename button and form for one file"""
+    state_key = f"rename_{resource_type}_{file_name}_active"
+    if st.button(f"Rename {short_file_name(file_name)}", key=f"rename_{resource_type}_{file_name}"):
+        st.session_state[state_key] = True
+
+    if st.session_state.get(state_key, False):
+        with st.form(key=f"rename_form_{resource_type}_{file_name}"):
+            new_name = st.text_input("New filename:", value=file_name)
+            col_a, col_b = st.columns(2)
+            with col_a:
+                if st.form_submit_button("Save"):
+                    if new_name != file_name:
+                        # Keep the original file extension
+                        _, file_extension = os.path.splitext(file_name)
+                        if not new_name.endswith(file_extension):
+                            new_name += file_extension
+
+                        # Rename the file
+                        file_path = resource_dir / file_name
+                        new_file_path = resource_dir / new_name
+                        resource = get_resource(file_path)
+                        if resource is None:
+                            st.error(f"{file_name} no longer exists")
+                        else:
+                            # The catalog entry stands in for a file with no local copy
+                            mtime_ns, size = resource["mtime_ns"], resource["size"]
+                            old_thumbnail_key = thumbnail_key(file_path, mtime_ns, size)
+                            get_storage().rename(storage_key(file_path), storage_key(new_file_path))
+                            move_thumbnail(old_thumbnail_key, new_file_path, mtime_ns, size)
+                            rename_resource(file_path, new_file_path)
+                            st.success(f"Renamed to {new_name}")
+                    st.session_state[state_key] = False
+                    rerun_fragment()
+            with col_b:
+                if st.form_submit_button("Cancel"):
+                    st.session_state[state_key] = False
+                    rerun_fragment()
+
+def record_views(resource_dir, file_names):
+    """Count the cards a student sees, once per session"""
+    viewed = st.session_state.setdefault("viewed_resources", set())
+    new = [resource_dir / name for name in file_names if resource_dir / name not in viewed]
+    viewed.update(new)
+    record_events(VIEW, new)
+
+def change_page(page_key, delta):
+    """Move a gallery to the previous or next page"""
+    st.session_state[page_key] = st.session_state.get(page_key, 0) + delta
+
+def render_pagination(page_key, total):
+    """Show page controls for a list of `total` items and return the current page index"""
+    page_count = max((total + GALLERY_PAGE_SIZE - 1) // GALLERY_PAGE_SIZE, 1)
+    page = max(min(st.session_state.get(page_key, 0), page_count - 1), 0)
+    st.session_state[page_key] = page
+    if page_count == 1:
+        return page
+
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("← Previous", key=f"{page_key}_prev", disabled=page == 0,
+                  on_click=change_page, args=(page_key, -1))
+    with col_info:
+        st.markdown(f"<p style='text-align:center'>Page {page + 1} of {page_count} ({total} files)</p>", unsafe_allow_html=True)
+    with col_next:
+        st.button("Next →", key=f"{page_key}_next", disabled=page == page_count - 1,
+                  on_click=change_page, args=(page_key, 1))
+    return page
+
+def cached_gallery(course_path, resource_type):
+    """Return the render cache entry of a course's resource type.
+
+    Entries hold the file count and the card HTML of every page rendered so
+    far. They are tied to the catalog version of the course, which changes on
+    every upload, rename, deletion and preview update, so a stale entry is
+    replaced rather than served. The cards hold absolute links built from the
+    host the session connected to, so each host gets its own entry.
+    """
+    index_course(course_path)
+    version = get_course_version(course_path)
+    key = (course_key(course_path), resource_type, get_resource_server_base_url())
+    with _card_cache_lock:
+        entry = _card_cache.get(key)
+        if entry is None or entry["version"] != version:
+            entry = _card_cache[key] = {"version": version, "total": None, "pages": {}}
+        _card_cache.move_to_end(key)
+        while len(_card_cache) > CARD_CACHE_ENTRIES:
+            _card_cache.popitem(last=False)
+    return entry
+
+def gallery_total(course_path, resource_type):
+    """Count the resources of one type for a course, from the render cache when possible"""
+    entry = cached_gallery(course_path, resource_type)
+    if entry["total"] is None:
+        entry["total"] = count_resources(course_path, resource_type)
+    return entry["total"]
+
+def gallery_page(course_path, resource_type, page):
+    """Return the file names and card HTML of one gallery page, from the render cache when possible"""
+    entry = cached_gallery(course_path, resource_type)
+    cached = entry["pages"].get(page)
+    if cached is not None:
+        increment("card_cache_hits_total")
+        return cached
+
+    increment("card_cache_misses_total")
+    resources = list_resources(course_path, resource_type, limit=GALLERY_PAGE_SIZE, offset=page * GALLERY_PAGE_SIZE)
+    resource_dir = course_path / resource_type
+    with timed("card_html_seconds"):
+        cards = "".join(file_card_html(resource_dir / resource["name"], resource) for resource in resources)
+    entry["pages"][page] = ([resource["name"] for resource in resources], cards)
+    return entry["pages"][page]
+
+@st.fragment
+def render_resource_gallery(course_path, resource_type, empty_message):
+    """Render one page of resource cards for a course and resource type.
+
+    Only the cards of the visible page are queried and built, so rendering
+    cost does not grow with the number of files in the course, and built pages
+    are reused until the course changes. The gallery is a fragment, so paging
+    and renaming rerun it without the rest of the page.
+    """
+    total = gallery_total(course_path, resource_type)
+    if not total:
+        st.markdown(f"<p>{empty_message}</p>", unsafe_allow_html=True)
+        return
+
+    st.markdown(bundle_download_link(course_path, resource_type, f"Download all {total} as ZIP"), unsafe_allow_html=True)
+    page = render_pagination(f"gallery_page_{course_key(course_path)}_{resource_type}", total)
+    file_names, cards = gallery_page(course_path, resource_type, page)
+    render_cards(cards)
+    if not st.session_state.is_admin:
+        record_views(course_path / resource_type, file_names)
+
+    # Add rename functionality (only for admins)
+    if st.session_state.is_admin:
+        for file_name in file_names:
+            render_rename_controls(course_path / resource_type, resource_type, file_name)
+
+def course_label(course_dir):
+    """Show a catalog course key as University › Semester › Course"""
+    return " › ".join(html.escape(part.replace("_", " ")) for part in course_dir.split("/"))
+
+def render_search_results(query):
+    """Show the resources of every course that best match a search query"""
+    results = search_resources(query)
+    if not results:
+        st.markdown(f"<p>No resources match “{html.escape(query)}”.</p>", unsafe_allow_html=True)
+        return
+
+    st.markdown(f"<p>Top {len(results)} matches for “{html.escape(query)}”</p>", unsafe_allow_html=True)
+    with timed("card_html_seconds"):
+        cards = "".join(file_card_html(resource["file_path"], resource, caption=course_label(resource["course_dir"]))
+                        for resource in results)
+    render_cards(cards)
@@ -0,0 +1,321 @@
+import bisect
+import hashlib
+import uuid
+
+# Version of the settings.json layout written by Hierarchy.to_dict
+SCHEMA_VERSION = 2
+
+
+def new_node_id():
+    """Generate a stable identifier for a new university, semester or course"""
+    return uuid.uuid4().hex[:12]
+
+
+def legacy_node_id(*names):
+    """Derive a deterministic identifier for a node migrated from the old layout.
+
+    Every process migrating the same file must agree on the IDs, so they are
+    computed from the node's path of names rather than generated randomly.
+    """
+    return hashlib.sha1("\0".join(names).encode()).hexdigest()[:12]
+
+
+def _without(children, node_id):
+    """Return a copy of a child dict with one entry removed"""
+    return {child_id: child for child_id, child in children.items() if child_id != node_id}
+
+
+class NameIndex:
+    """Sibling nodes sorted by every word of their names, for type-ahead lookups.
+
+    Each node is entered once per word, keyed by its name from that word on,
+    so "calc" finds both "Calculus I" and "Advanced Calculus" with a bisection
+    instead of a scan over every name.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self.ids = {node.id for node in self.nodes}
+        entries = sorted(
+            (" ".join(words[i:]), position)
+            for position, words in enumerate(node.name.casefold().split() for node in self.nodes)
+            for i in range(len(words))
+        )
+        self.keys = [key for key, _ in entries]
+        self.positions = [position for _, position in entries]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return getattr(node, "id", None) in self.ids
+
+    def search(self, prefix, limit):
+        """Return up to `limit` nodes with a word starting with `prefix`, and whether more matched"""
+        prefix = " ".join(prefix.casefold().split())
+        if not prefix:
+            return self.nodes[:limit], len(self.nodes) > limit
+
+        matches = {}
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and len(matches) <= limit:
+            matches.setdefault(self.positions[i], self.nodes[self.positions[i]])
+            i += 1
+        nodes = list(matches.values())
+        return nodes[:limit], len(nodes) > limit
+
+
+class Course:
+    __slots__ = ("id", "name", "semester")
+
+    def __init__(self, node_id, name, semester):
+        self.id = node_id
+        self.name = name
+        self.semester = semester
+
+    @property
+    def university(self):
+        return self.semester.university
+
+    def __repr__(self):
+        return f"Course({self.id!r}, {self.name!r})"
+
+
+class Semester:
+    __slots__ = ("id", "name", "university", "courses")
+
+    def __init__(self, node_id, name, university):
+        self.id = node_id
+        self.name = name
+        self.university = university
+        self.courses = {}
+
+    def course_count(self):
+        return len(self.courses)
+
+    def __repr__(self):
+        return f"Semester({self.id!r}, {self.name!r})"
+
+
+class University:
+    __slots__ = ("id", "name", "semesters")
+
+    def __init__(self, node_id, name):
+        self.id = node_id
+        self.name = name
+        self.semesters = {}
+
+    def course_count(self):
+        return sum(len(semester.courses) for semester in self.semesters.values())
+
+    def __repr__(self):
+        return f"University({self.id!r}, {self.name!r})"
+
+
+class Hierarchy:
+    """University -> Semester -> Course tree with every node indexed by ID.
+
+    Children are kept in insertion-ordered dicts keyed by ID, and a flat index
+    maps any ID to its node, so lookups are O(1) and removals only touch the
+    removed subtree. The tree is shared by every session and background
+    thread, so child dicts and the flat index are replaced rather than
+    mutated: a reader iterating over them never sees them change underneath it.
+    """
+
+    def __init__(self):
+        self.universities = {}
+        self.nodes = {}
+        self.version = 0
+        self._name_indexes = {}  # parent ID (None for universities) -> (children dict, NameIndex)
+        # Set while a tree nobody else can see yet is built, so the index is filled in place
+        self._building = False
+
+    # Lookups
+
+    def get(self, node_id):
+        return self.nodes.get(node_id)
+
+    def find_university(self, name):
+        return next((uni for uni in self.universities.values() if uni.name == name), None)
+
+    @staticmethod
+    def find_child(parent, name):
+        """Return the semester or course of a parent with the given name"""
+        children = parent.semesters if isinstance(parent, University) else parent.courses
+        return next((child for child in children.values() if child.name == name), None)
+
+    def children(self, parent=None):
+        """Return the child dict of a node, or the universities when `parent` is None"""
+        if parent is None:
+            return self.universities
+        return parent.semesters if isinstance(parent, University) else parent.courses
+
+    def name_index(self, parent=None):
+        """Return the NameIndex of a node's children, building it on first use.
+
+        Child dicts are replaced on every change, so an index is current as
+        long as it was built from the dict the parent holds now.
+        """
+        children = self.children(parent)
+        parent_id = parent.id if parent is not None else None
+        cached = self._name_indexes.get(parent_id)
+        if cached is None or cached[0] is not children:
+            cached = self._name_indexes[parent_id] = (children, NameIndex(children.values()))
+        return cached[1]
+
+    # Mutations
+
+    def _index(self, node):
+        if self._building:
+            self.nodes[node.id] = node
+        else:
+            self.nodes = {**self.nodes, node.id: node}
+
+    def add_university(self, name, node_id=None):
+        uni = University(node_id or new_node_id(), name)
+        self.universities = {**self.universities, uni.id: uni}
+        self._index(uni)
+        return uni
+
+    def add_semester(self, university_id, name, node_id=None):
+        uni = self.universities[university_id]
+        semester = Semester(node_id or new_node_id(), name, uni)
+        uni.semesters = {**uni.semesters, semester.id: semester}
+        self._index(semester)
+        return semester
+
+    def add_course(self, semester_id, name, node_id=None):
+        semester = self.nodes[semester_id]
+        course = Course(node_id or new_node_id(), name, semester)
+        semester.courses = {**semester.courses, course.id: course}
+        self._index(course)
+        return course
+
+    def remove(self, node_id):
+        """Remove a node together with everything below it"""
+        node = self.nodes.get(node_id)
+        if node is None:
+            return None
+        self._name_indexes.pop(node_id, None)
+        removed = {node_id}
+        if isinstance(node, University):
+            self.universities = _without(self.universities, node_id)
+            for semester in node.semesters.values():
+                removed.add(semester.id)
+                removed.update(semester.courses)
+        elif isinstance(node, Semester):
+            node.university.semesters = _without(node.university.semesters, node_id)
+            removed.update(node.courses)
+        else:
+            node.semester.courses = _without(node.semester.courses, node_id)
+        self.nodes = {other_id: other for other_id, other in self.nodes.items() if other_id not in removed}
+        return node
+
+    def apply_change(self, change):
+        """Apply one journalled change"""
+        if "id" not in change:
+            change = self.translate_legacy_change(change)
+            if change is None:
+                return
+        op = change["op"]
+        if op == "add_university":
+            if change["id"] not in self.nodes:
+                self.add_university(change["name"], change["id"])
+        elif op == "add_semester":
+            if change["id"] not in self.nodes and change["parent_id"] in self.nodes:
+                self.add_semester(change["parent_id"], change["name"], change["id"])
+        elif op == "add_course":
+            if change["id"] not in self.nodes and change["parent_id"] in self.nodes:
+                self.add_course(change["parent_id"], change["name"], change["id"])
+        elif op == "remove":
+            self.remove(change["id"])
+        else:
+            raise ValueError(f"Unknown settings change: {op}")
+
+    def translate_legacy_change(self, change):
+        """Map a name-based journal entry written before nodes had IDs onto IDs.
+
+        Returns None when the entry refers to nodes that no longer exist.
+        """
+        op = change["op"]
+        kind = op.split("_", 1)[1]
+        names = [change["university"]]
+        if kind in ("semester", "course"):
+            names.append(change["semester"])
+        if kind == "course":
+            names.append(change["course"])
+
+        # Resolve the path of names down to the deepest existing node
+        node = self.find_university(names[0])
+        path = [node]
+        for name in names[1:]:
+            node = self.find_child(node, name) if node is not None else None
+            path.append(node)
+
+        if op.startswith("remove_"):
+            return {"op": "remove", "id": path[-1].id} if path[-1] is not None else None
+        if path[-1] is not None or (len(path) > 1 and path[-2] is None):
+            return None
+        translated = {"op": op, "id": legacy_node_id(*names), "name": names[-1]}
+        if len(path) > 1:
+            translated["parent_id"] = path[-2].id
+        return translated
+
+    # Serialization
+
+    def to_dict(self):
+        return {
+            "schema": SCHEMA_VERSION,
+            "version": self.version,
+            "universities": [
+                {
+                    "id": uni.id,
+                    "name": uni.name,
+                    "semesters": [
+                        {
+                            "id": semester.id,
+                            "name": semester.name,
+                            "courses": [{"id": course.id, "name": course.name}
+                                        for course in semester.courses.values()],
+                        }
+                        for semester in uni.semesters.values()
+                    ],
+                }
+                for uni in self.universities.values()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a hierarchy from settings.json, migrating the old flat layout"""
+        if data.get("schema", 1) < SCHEMA_VERSION:
+            return cls.from_legacy_dict(data)
+
+        hierarchy = cls()
+        hierarchy._building = True
+        hierarchy.version = data.get("version", 0)
+        for uni_data in data.get("universities", []):
+            uni = hierarchy.add_university(uni_data["name"], uni_data["id"])
+            for semester_data in uni_data.get("semesters", []):
+                semester = hierarchy.add_semester(uni.id, semester_data["name"], semester_data["id"])
+                for course_data in semester_data.get("courses", []):
+                    hierarchy.add_course(semester.id, course_data["name"], course_data["id"])
+        hierarchy._building = False
+        return hierarchy
+
+    @classmethod
+    def from_legacy_dict(cls, data):
+        """Convert the original layout whose courses were keyed by "uni_semester" strings"""
+        hierarchy = cls()
+        hierarchy._building = True
+        hierarchy.version = data.get("version", 0)
+        courses = data.get("courses", {})
+        for uni_name in data.get("universities", []):
+            uni = hierarchy.add_university(uni_name, legacy_node_id(uni_name))
+            for semester_name in data.get("semesters", {}).get(uni_name, []):
+                semester = hierarchy.add_semester(uni.id, semester_name, legacy_node_id(uni_name, semester_name))
+                for course_name in courses.get(f"{uni_name}_{semester_name}", []):
+                    hierarchy.add_course(semester.id, course_name,
+                                         legacy_node_id(uni_name, semester_name, course_name))
+        hierarchy._building = False
+        return hierarchy
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from config import BLOBS_DIR, INGEST_CHUNK_SIZE
+from storage import get_storage, storage_key
+
+
+def blob_path(sha256):
+    """Return where the blob with the given hash is stored"""
+    return BLOBS_DIR / sha256[:2] / sha256[2:]
+
+
+def store_blob(stream):
+    """Copy a stream into the blob store in chunks, hashing it on the way.
+
+    Returns (sha256, blob path). Content that is already stored is discarded,
+    so each distinct file occupies disk only once.
+    """
+    tmp_dir = BLOBS_DIR / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+        try:
+            for chunk in iter(lambda: stream.read(INGEST_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+
+    sha256 = digest.hexdigest()
+    path = blob_path(sha256)
+    if path.exists():
+        os.remove(tmp.name)
+        # Mark the blob as in use so the orphan reconciler does not reclaim it before it is linked.
+        # A chmod only updates the inode change time; touching the modification time would also
+        # change every upload linked to the blob and invalidate their catalog entries.
+        os.chmod(path, os.stat(path).st_mode)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp.name, path)
+    return sha256, path
+
+
+def unique_destination(directory, file_name):
+    """Pick a file name in a directory that does not overwrite an existing file"""
+    storage = get_storage()
+    destination = Path(directory) / file_name
+    stem, extension = os.path.splitext(file_name)
+    counter = 1
+    while storage.exists(storage_key(destination)):
+        destination = Path(directory) / f"{stem} ({counter}){extension}"
+        counter += 1
+    return destination
+
+
+def link_into_directory(blob, resource_dir, file_name):
+    """Store a blob in a course resource directory under a free name.
+
+    With local storage the bytes are shared with the blob via a hard link.
+    """
+    while True:
+        destination = unique_destination(resource_dir, file_name)
+        try:
+            get_storage().put_file(storage_key(destination), blob, exclusive=True)
+            return destination
+        except FileExistsError:
+            # Another upload took the name in the meantime; pick the next one
+            continue
@@ -0,0 +1,237 @@
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from catalog import (file_sha256, get_connection, index_course, resource_key, set_resource_hash, set_text_extracted,
+                     set_thumbnail_status)
+from config import JOB_WORKERS, UPLOADS_DIR
+from extraction import can_extract, extract_text
+from search import set_resource_texts
+from storage import get_storage, storage_key
+from thumbnails import pdfium, render_preview
+from transcode import store_transcoded_image, transcode_image
+
+logger = logging.getLogger(__name__)
+
+# A failed job is retried until it has been attempted this many times
+MAX_ATTEMPTS = 3
+
+# Seconds between checks for jobs queued by other processes
+POLL_INTERVAL = 2.0
+
+# Set when a job is queued by this process so the dispatcher wakes up at once
+_wakeup = threading.Event()
+
+
+def finish_text_extraction(file_path, result):
+    """Store the text and page count extracted from a resource"""
+    text, page_count = result
+    set_resource_texts([(file_path, text)])
+    set_text_extracted(file_path, page_count)
+
+
+# Job kind -> (function run in a worker process with the file path, function storing its result)
+JOB_KINDS = {
+    "extract_text": (extract_text, finish_text_extraction),
+    "render_preview": (render_preview, set_thumbnail_status),
+    "transcode_image": (transcode_image, store_transcoded_image),
+    "hash_resource": (file_sha256, set_resource_hash),
+}
+
+
+def run_job(kind, file_path):
+    """Run a job's work in a worker process, first fetching the file if it is stored elsewhere"""
+    get_storage().local_path(storage_key(file_path))
+    work, _ = JOB_KINDS[kind]
+    return work(file_path)
+
+
+def enqueue_jobs(kind, file_paths):
+    """Queue a job of the given kind for each catalogued resource"""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO jobs (kind, course_dir, resource_type, name, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [(kind, *resource_key(file_path), now) for file_path in file_paths],
+        )
+    _wakeup.set()
+
+
+def pending_job_count():
+    """Count the jobs that are queued or running"""
+    return get_connection().execute(
+        "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+    ).fetchone()[0]
+
+
+def job_file_path(job):
+    return UPLOADS_DIR / job["course_dir"] / job["resource_type"] / job["name"]
+
+
+def requeue_interrupted_jobs():
+    """Put back jobs that were running when the portal or a worker last stopped"""
+    conn = get_connection()
+    with conn:
+        # A job that keeps taking its worker down gives up like any other failing job
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, updated_at = ? "
+            "WHERE status = 'running'",
+            (MAX_ATTEMPTS, time.time()),
+        )
+
+
+def queue_missing_pdf_previews():
+    """Queue previews for PDFs uploaded before previews could be rendered"""
+    if pdfium is None:
+        return
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (kind, course_dir, resource_type, name, updated_at) "
+            "SELECT 'render_preview', course_dir, resource_type, name, ? FROM resources r "
+            "WHERE thumbnail_status = 'none' AND lower(name) LIKE '%.pdf' AND NOT EXISTS ("
+            "SELECT 1 FROM jobs j WHERE j.kind = 'render_preview' AND j.course_dir = r.course_dir "
+            "AND j.resource_type = r.resource_type AND j.name = r.name)",
+            (time.time(),),
+        )
+
+
+def queue_missing_text():
+    """Queue text extraction for resources that never had it, e.g. files found by a course scan"""
+    rows = get_connection().execute(
+        "SELECT r.course_dir, r.resource_type, r.name FROM resources r "
+        "JOIN search_documents d USING (course_dir, resource_type, name) "
+        # Text found before extraction was recorded counts as extracted
+        "JOIN search_index s ON s.rowid = d.id "
+        "WHERE r.text_extracted = 0 AND s.body = '' AND NOT EXISTS ("
+        "SELECT 1 FROM jobs j WHERE j.kind = 'extract_text' AND j.course_dir = r.course_dir "
+        "AND j.resource_type = r.resource_type AND j.name = r.name)"
+    ).fetchall()
+    file_paths = [job_file_path(row) for row in rows if can_extract(row["name"])]
+    if file_paths:
+        enqueue_jobs("extract_text", file_paths)
+
+
+def backfill_catalog(course_paths):
+    """Index every course and queue text extraction for what was found.
+
+    Courses are otherwise only indexed when first viewed, so search and the
+    statistics would miss those nobody opened yet.
+    """
+    for course_path in course_paths:
+        try:
+            index_course(course_path)
+        except Exception:
+            # One unreadable course must not keep the others out of the catalog
+            logger.exception("Could not index %s", course_path)
+    queue_missing_text()
+
+
+def claim_jobs(count):
+    """Mark up to `count` queued jobs as running and return them"""
+    conn = get_connection()
+    with conn:
+        return conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+            "WHERE id IN (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT ?) RETURNING *",
+            (time.time(), count),
+        ).fetchall()
+
+
+def complete_job(job_id):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+def fail_job(job_id, error):
+    """Record a failed attempt, queueing the job again unless it ran out of attempts"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+            "error = ?, updated_at = ? WHERE id = ?",
+            (MAX_ATTEMPTS, error, time.time(), job_id),
+        )
+
+
+class JobQueue:
+    """Runs queued jobs on a bounded pool of worker processes.
+
+    Jobs live in the catalog database, so uploads return as soon as their jobs
+    are queued and a restart resumes whatever was left unfinished. A single
+    dispatcher thread claims jobs, hands them to the pool and stores results.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.thread = None
+
+    def start(self, course_paths=None):
+        """Start dispatching; `course_paths` returns the courses to index in the background first"""
+        requeue_interrupted_jobs()
+        queue_missing_pdf_previews()
+        queue_missing_text()
+        self.pool = self.new_pool()
+        self.thread = threading.Thread(target=self.run, name="job-dispatcher", daemon=True)
+        self.thread.start()
+        if course_paths is not None:
+            threading.Thread(target=lambda: backfill_catalog(course_paths()), name="catalog-backfill",
+                             daemon=True).start()
+        return self
+
+    def new_pool(self):
+        # Forking a process that runs Streamlit's threads is unsafe, so workers are spawned
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def run(self):
+        running = {}
+        while True:
+            try:
+                for job in claim_jobs(self.workers - len(running)):
+                    running[self.pool.submit(run_job, job["kind"], job_file_path(job))] = job["id"]
+
+                if running:
+                    done, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.finish(running.pop(future), future)
+                else:
+                    _wakeup.wait(POLL_INTERVAL)
+                    _wakeup.clear()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory) and took the pool down; every job
+                # it held is retried on a fresh pool
+                logger.exception("A job worker died; restarting the pool")
+                running.clear()
+                requeue_interrupted_jobs()
+                self.pool = self.new_pool()
+            except RuntimeError as e:
+                if sys.is_finalizing() or "shutdown" in str(e):
+                    # The interpreter is exiting; claimed jobs are requeued on the next start
+                    return
+                logger.exception("Job dispatch failed")
+                time.sleep(POLL_INTERVAL)
+            except Exception:
+                # Keep dispatching; a broken job must not stop the queue
+                logger.exception("Job dispatch failed")
+                time.sleep(POLL_INTERVAL)
+
+    def finish(self, job_id, future):
+        """Store the result of a job that left the pool"""
+        # Re-read the job: its resource may have been renamed while it ran
+        job = get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return  # The resource was deleted in the meantime
+        try:
+            _, store = JOB_KINDS[job["kind"]]
+            store(job_file_path(job), future.result())
+        except Exception as e:
+            fail_job(job_id, f"{type(e).__name__}: {e}")
+        else:
+            complete_job(job_id)
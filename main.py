@@ -1,28 +1,30 @@
 import streamlit as st
 
-# Page configuration must be the first Streamlit command
-st.set_page_config(
-    page_title="Student Resource Portal",
-    page_icon="📚",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+from metrics import page_run, start_page_run
+
+# Job worker processes are spawned and re-import this file as __mp_main__, so
+# the page is only drawn and background services only started under __main__
+if __name__ == "__main__":
+    # Page configuration must be the first Streamlit command
+    st.set_page_config(
+        page_title="Student Resource Portal",
+        page_icon="📚",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    # Time the whole run, including loading settings below
+    start_page_run()
 
-import pandas as pd
-import os
-import json
-import base64
-from datetime import datetime
 from pathlib import Path
-import shutil
-from PIL import Image
-import io
 
-from utils import load_settings, save_settings, get_file_path, create_directory_if_not_exists
+from utils import load_settings, get_course_path, create_directory_if_not_exists, format_count, format_size, node_stats, select_node, start_analytics, start_resource_server, start_job_queue, start_garbage_collector
 from admin import show_admin_panel
+from gallery import RESOURCE_TABS, bundle_download_link, gallery_total, render_resource_gallery, render_search_results
+from bundles import ALL_TYPES
+from catalog import RESOURCE_TYPES
 
 # Custom CSS to match the design in the example
-st.markdown("""
+PAGE_CSS = """
 <style>
     .main-header {
         text-align: center;
@@ -124,83 +126,87 @@ st.markdown("""
         margin-top: 1rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-# Page configuration was already set at the top of the file
+def init_session():
+    """Set up session state, settings and data directories for this run"""
+    # Create required directories
+    data_dir = Path("data")
+    uploads_dir = data_dir / "uploads"
+    create_directory_if_not_exists(data_dir)
+    create_directory_if_not_exists(uploads_dir)
 
-# Initialize session state if not already done
-if 'is_admin' not in st.session_state:
-    st.session_state.is_admin = False
-if 'settings' not in st.session_state:
+    # Initialize session state if not already done
+    if 'is_admin' not in st.session_state:
+        st.session_state.is_admin = False
+    # Settings are shared across sessions and only re-read when the file changes
     st.session_state.settings = load_settings()
 
-# Create required directories
-data_dir = Path("data")
-uploads_dir = data_dir / "uploads"
-create_directory_if_not_exists(data_dir)
-create_directory_if_not_exists(uploads_dir)
+def start_services():
+    """Start the background services once per process"""
+    # Downloads are streamed by a companion server instead of being inlined into the page
+    start_resource_server()
+    # Text extraction and OCR of uploads run in background worker processes
+    start_job_queue()
+    # Deleted universities, semesters and courses are reclaimed in the background
+    start_garbage_collector()
+    # Downloads and views are buffered and written to the catalog in batches
+    start_analytics()
+
+@st.cache_data
+def load_logo():
+    """Read the sidebar logo once instead of on every rerun"""
+    with open("assets/logo.svg", "r") as f:
+        return f.read()
 
-# Main header
-st.markdown('<div class="main-header"><h1>Student Resource Portal</h1><p>Access past exams, study sheets, and helpful tips</p></div>', unsafe_allow_html=True)
+def render_header():
+    """Show the portal title above every page"""
+    st.markdown('<div class="main-header"><h1>Student Resource Portal</h1><p>Access past exams, study sheets, and helpful tips</p></div>', unsafe_allow_html=True)
 
-# Sidebar content
-with st.sidebar:
-    # Display logo if available
-    try:
-        with open("assets/logo.svg", "r") as f:
-            svg = f.read()
-            st.image(svg, width=200)
-    except:
-        pass
+def render_sidebar():
+    """Show the logo and the admin login or logout controls"""
+    with st.sidebar:
+        # Display logo if available
+        try:
+            st.image(load_logo(), width=200)
+        except:
+            pass
     
-    st.markdown('<h2>StudyHub</h2>', unsafe_allow_html=True)
+        st.markdown('<h2>StudyHub</h2>', unsafe_allow_html=True)
     
-    # Admin Login/Logout Section
-    cols = st.columns([1, 1])
-    if not st.session_state.is_admin:
-        # Login button that opens a modal
-        with cols[1]:
-            if st.button("Admin Portal", key="admin_login"):
-                st.session_state.show_login = True
+        # Admin Login/Logout Section
+        cols = st.columns([1, 1])
+        if not st.session_state.is_admin:
+            # Login button that opens a modal
+            with cols[1]:
+                if st.button("Admin Portal", key="admin_login"):
+                    st.session_state.show_login = True
                 
-        # Login modal
-        if st.session_state.get('show_login', False):
-            with st.form("login_form"):
-                st.subheader("Admin Login")
-                admin_username = st.text_input("Username")
-                admin_password = st.text_input("Password", type="password")
-                submitted = st.form_submit_button("Login")
+            # Login modal
+            if st.session_state.get('show_login', False):
+                with st.form("login_form"):
+                    st.subheader("Admin Login")
+                    admin_username = st.text_input("Username")
+                    admin_password = st.text_input("Password", type="password")
+                    submitted = st.form_submit_button("Login")
                 
-                if submitted:
-                    if admin_username == "llouay26" and admin_password == "LouayX2006@":  # Custom admin credentials
-                        st.session_state.is_admin = True
-                        st.session_state.show_login = False
-                        st.success("Logged in as admin!")
-                        st.rerun()
-                    else:
-                        st.error("Incorrect username or password!")
-    else:
-        with cols[1]:
-            if st.button("Logout"):
-                st.session_state.is_admin = False
-                st.rerun()
-
-def file_download_link(file_path, file_name):
-    """Generate a download link for a file"""
-    with open(file_path, "rb") as f:
-        data = f.read()
-    b64 = base64.b64encode(data).decode()
-    file_size = os.path.getsize(file_path) / 1024  # Size in KB
-    short_name = file_name
-    if len(short_name) > 20:
-        # Truncate name if too long (for display)
-        name_parts = os.path.splitext(file_name)
-        short_name = name_parts[0][:17] + "..." + name_parts[1]
-    return f'<a href="data:application/octet-stream;base64,{b64}" download="{file_name}" class="download-btn">Download ({file_size:.1f} KB)</a>'
+                    if submitted:
+                        if admin_username == "llouay26" and admin_password == "LouayX2006@":  # Custom admin credentials
+                            st.session_state.is_admin = True
+                            st.session_state.show_login = False
+                            st.success("Logged in as admin!")
+                            st.rerun()
+                        else:
+                            st.error("Incorrect username or password!")
+        else:
+            with cols[1]:
+                if st.button("Logout"):
+                    st.session_state.is_admin = False
+                    st.rerun()
 
 def main():
     # Main content
-    settings = st.session_state.settings
+    hierarchy = st.session_state.settings
     
     # If admin is logged in, show admin panel
     if st.session_state.is_admin:
@@ -210,41 +216,52 @@ def main():
     # Student view - Find Study Resources section
     st.markdown('<div class="resource-section"><h2 class="resource-header">Find Study Resources</h2>', unsafe_allow_html=True)
     
+    # Search across every course instead of browsing one course at a time
+    query = st.text_input("Search", placeholder="Search all resources, e.g. 2019 final", key="search_query",
+                          label_visibility="collapsed")
+    if query.strip():
+        render_search_results(query)
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+    
     # Create three columns for university, semester, and course selection
     col1, col2, col3 = st.columns(3)
     
     # University selection
-    universities = settings.get("universities", [])
-    if not universities:
+    if not hierarchy.universities:
         st.warning("No universities available. Admin needs to add universities.")
         st.markdown('</div>', unsafe_allow_html=True)
         return
     
     with col1:
         st.markdown("<p>Select University</p>", unsafe_allow_html=True)
-        selected_uni = st.selectbox("University", universities, label_visibility="collapsed")
+        selected_uni = select_node("University", hierarchy, None, key="student_uni_select", label_visibility="collapsed")
     
     # Semester selection
-    semesters = settings.get("semesters", {}).get(selected_uni, [])
-    if not semesters:
-        st.warning(f"No semesters available for {selected_uni}. Admin needs to add semesters.")
+    if selected_uni is None:
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+    if not selected_uni.semesters:
+        st.warning(f"No semesters available for {selected_uni.name}. Admin needs to add semesters.")
         st.markdown('</div>', unsafe_allow_html=True)
         return
     
     with col2:
         st.markdown("<p>Select Semester</p>", unsafe_allow_html=True)
-        selected_semester = st.selectbox("Semester", semesters, label_visibility="collapsed")
+        selected_semester = select_node("Semester", hierarchy, selected_uni, key="student_sem_select", label_visibility="collapsed")
     
     # Course selection
-    courses = settings.get("courses", {}).get(f"{selected_uni}_{selected_semester}", [])
-    if not courses:
-        st.warning(f"No courses available for {selected_uni}, {selected_semester}. Admin needs to add courses.")
+    if selected_semester is None:
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+    if not selected_semester.courses:
+        st.warning(f"No courses available for {selected_uni.name}, {selected_semester.name}. Admin needs to add courses.")
         st.markdown('</div>', unsafe_allow_html=True)
         return
     
     with col3:
         st.markdown("<p>Select Course</p>", unsafe_allow_html=True)
-        selected_course = st.selectbox("Course", courses, label_visibility="collapsed")
+        selected_course = select_node("Course", hierarchy, selected_semester, key="student_course_select", label_visibility="collapsed")
     
     # Find Resources button
     btn_col1, btn_col2, btn_col3 = st.columns([2, 1, 2])
@@ -254,281 +271,35 @@ def main():
     
     # Display resources if all selections are made
     if selected_uni and selected_semester and selected_course:
-        st.markdown(f"<div class='resource-section'><h2>Resources for {selected_course}</h2>", unsafe_allow_html=True)
+        # Generate file path for resources
+        resource_path = get_course_path(selected_course)
+        
+        course_header = f"<div class='resource-section'><h2>Resources for {selected_course.name}</h2>"
+        if any(gallery_total(resource_path, resource_type) for resource_type in RESOURCE_TYPES):
+            # Read after the galleries above have catalogued the course
+            files, size = node_stats([selected_course])[selected_course.id].get("*", (0, 0))
+            course_header += f"<p>{format_count(files, 'file')} · {format_size(size)}</p>"
+            course_header += bundle_download_link(resource_path, ALL_TYPES, "Download entire course as ZIP")
+        st.markdown(course_header, unsafe_allow_html=True)
         
         # Create tabs container with custom CSS
         st.markdown('<div class="tab-container">', unsafe_allow_html=True)
         
-        # Define tabs for different resource types
-        tab1, tab2, tab3 = st.tabs(["Past Exams", "Study Sheets", "Tips & Guides"])
-        
-        # Generate file path for resources
-        resource_path = get_file_path(selected_uni, selected_semester, selected_course)
-        create_directory_if_not_exists(resource_path)
-        
-        # Display exams
-        with tab1:
-            exam_path = resource_path / "exams"
-            create_directory_if_not_exists(exam_path)
-            
-            exams = os.listdir(exam_path) if os.path.exists(exam_path) else []
-            if exams:
-                # Start file container
-                st.markdown('<div class="file-container">', unsafe_allow_html=True)
-                
-                for exam in exams:
-                    file_path = exam_path / exam
-                    file_date = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d')
-                    
-                    # Create a file card with HTML for better layout control
-                    file_html = '<div class="file-card">'
-                    
-                    # Add thumbnail container
-                    file_html += '<div class="thumbnail-container">'
-                    if exam.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                        # For images, convert to base64 to embed directly in HTML
-                        with open(file_path, "rb") as f:
-                            img_data = base64.b64encode(f.read()).decode()
-                        file_html += f'<img src="data:image/png;base64,{img_data}" style="max-width:100%; max-height:100px;" />'
-                    elif exam.lower().endswith(('.pdf')):
-                        # For PDFs, show a PDF icon
-                        file_html += '<div class="file-icon">📄</div>'
-                    else:
-                        # For other files show a generic file icon
-                        file_html += '<div class="file-icon">📁</div>'
-                    file_html += '</div>'
-                    
-                    # Add file name (shortened if needed)
-                    short_name = exam
-                    if len(short_name) > 20:
-                        name_parts = os.path.splitext(exam)
-                        short_name = name_parts[0][:17] + "..." + name_parts[1]
-                    file_html += f'<div class="file-name">{short_name}</div>'
-                    
-                    # Add download button
-                    download_link = file_download_link(file_path, exam)
-                    file_html += download_link
-                    
-                    # Add upload date
-                    file_html += f'<div style="font-size:0.8rem; text-align:center; margin-top:0.5rem;">Uploaded: {file_date}</div>'
-                    
-                    # Close file card
-                    file_html += '</div>'
-                    
-                    # Output the HTML
-                    st.markdown(file_html, unsafe_allow_html=True)
-                    
-                    # Add rename functionality in a separate column (only for admins)
-                    if st.session_state.is_admin:
-                        # We use an empty element with custom key to create separate UI elements for each file
-                        rename_key = f"rename_container_{exam}"
-                        if st.button("Rename", key=f"rename_exam_{exam}"):
-                            st.session_state[f"rename_exam_{exam}_active"] = True
-                        
-                        if st.session_state.get(f"rename_exam_{exam}_active", False):
-                            with st.form(key=f"rename_form_exam_{exam}"):
-                                new_name = st.text_input("New filename:", value=exam)
-                                col_a, col_b = st.columns(2)
-                                with col_a:
-                                    if st.form_submit_button("Save"):
-                                        if new_name != exam:
-                                            # Get file extension
-                                            _, file_extension = os.path.splitext(exam)
-                                            if not new_name.endswith(file_extension):
-                                                new_name += file_extension
-                                            
-                                            # Rename the file
-                                            new_file_path = exam_path / new_name
-                                            os.rename(file_path, new_file_path)
-                                            st.success(f"Renamed to {new_name}")
-                                            st.session_state[f"rename_exam_{exam}_active"] = False
-                                            st.rerun()
-                                with col_b:
-                                    if st.form_submit_button("Cancel"):
-                                        st.session_state[f"rename_exam_{exam}_active"] = False
-                                        st.rerun()
-                
-                # End file container
-                st.markdown('</div>', unsafe_allow_html=True)
-            else:
-                st.markdown("<p>No exams found for this selection.</p>", unsafe_allow_html=True)
+        # Only the selected resource type is queried and rendered
+        selected_tab = st.segmented_control("Resource type", list(RESOURCE_TABS), default="Past Exams",
+                                            key="resource_tab", label_visibility="collapsed") or "Past Exams"
+        resource_type, empty_message = RESOURCE_TABS[selected_tab]
         
-        # Display study sheets
-        with tab2:
-            sheets_path = resource_path / "sheets"
-            create_directory_if_not_exists(sheets_path)
-            
-            sheets = os.listdir(sheets_path) if os.path.exists(sheets_path) else []
-            if sheets:
-                # Start file container
-                st.markdown('<div class="file-container">', unsafe_allow_html=True)
-                
-                for sheet in sheets:
-                    file_path = sheets_path / sheet
-                    file_date = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d')
-                    
-                    # Create a file card with HTML for better layout control
-                    file_html = '<div class="file-card">'
-                    
-                    # Add thumbnail container
-                    file_html += '<div class="thumbnail-container">'
-                    if sheet.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                        # For images, convert to base64 to embed directly in HTML
-                        with open(file_path, "rb") as f:
-                            img_data = base64.b64encode(f.read()).decode()
-                        file_html += f'<img src="data:image/png;base64,{img_data}" style="max-width:100%; max-height:100px;" />'
-                    elif sheet.lower().endswith(('.pdf')):
-                        # For PDFs, show a PDF icon
-                        file_html += '<div class="file-icon">📄</div>'
-                    else:
-                        # For other files show a generic file icon
-                        file_html += '<div class="file-icon">📁</div>'
-                    file_html += '</div>'
-                    
-                    # Add file name (shortened if needed)
-                    short_name = sheet
-                    if len(short_name) > 20:
-                        name_parts = os.path.splitext(sheet)
-                        short_name = name_parts[0][:17] + "..." + name_parts[1]
-                    file_html += f'<div class="file-name">{short_name}</div>'
-                    
-                    # Add download button
-                    download_link = file_download_link(file_path, sheet)
-                    file_html += download_link
-                    
-                    # Add upload date
-                    file_html += f'<div style="font-size:0.8rem; text-align:center; margin-top:0.5rem;">Uploaded: {file_date}</div>'
-                    
-                    # Close file card
-                    file_html += '</div>'
-                    
-                    # Output the HTML
-                    st.markdown(file_html, unsafe_allow_html=True)
-                    
-                    # Add rename functionality in a separate column (only for admins)
-                    if st.session_state.is_admin:
-                        # We use an empty element with custom key to create separate UI elements for each file
-                        rename_key = f"rename_container_{sheet}"
-                        if st.button("Rename", key=f"rename_sheet_{sheet}"):
-                            st.session_state[f"rename_sheet_{sheet}_active"] = True
-                        
-                        if st.session_state.get(f"rename_sheet_{sheet}_active", False):
-                            with st.form(key=f"rename_form_sheet_{sheet}"):
-                                new_name = st.text_input("New filename:", value=sheet)
-                                col_a, col_b = st.columns(2)
-                                with col_a:
-                                    if st.form_submit_button("Save"):
-                                        if new_name != sheet:
-                                            # Get file extension
-                                            _, file_extension = os.path.splitext(sheet)
-                                            if not new_name.endswith(file_extension):
-                                                new_name += file_extension
-                                            
-                                            # Rename the file
-                                            new_file_path = sheets_path / new_name
-                                            os.rename(file_path, new_file_path)
-                                            st.success(f"Renamed to {new_name}")
-                                            st.session_state[f"rename_sheet_{sheet}_active"] = False
-                                            st.rerun()
-                                with col_b:
-                                    if st.form_submit_button("Cancel"):
-                                        st.session_state[f"rename_sheet_{sheet}_active"] = False
-                                        st.rerun()
-                
-                # End file container
-                st.markdown('</div>', unsafe_allow_html=True)
-            else:
-                st.markdown("<p>No study sheets found for this selection.</p>", unsafe_allow_html=True)
-        
-        # Display tips and notes
-        with tab3:
-            tips_path = resource_path / "tips"
-            create_directory_if_not_exists(tips_path)
-            
-            tips = os.listdir(tips_path) if os.path.exists(tips_path) else []
-            if tips:
-                # Start file container
-                st.markdown('<div class="file-container">', unsafe_allow_html=True)
-                
-                for tip in tips:
-                    file_path = tips_path / tip
-                    file_date = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d')
-                    
-                    # Create a file card with HTML for better layout control
-                    file_html = '<div class="file-card">'
-                    
-                    # Add thumbnail container
-                    file_html += '<div class="thumbnail-container">'
-                    if tip.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                        # For images, convert to base64 to embed directly in HTML
-                        with open(file_path, "rb") as f:
-                            img_data = base64.b64encode(f.read()).decode()
-                        file_html += f'<img src="data:image/png;base64,{img_data}" style="max-width:100%; max-height:100px;" />'
-                    elif tip.lower().endswith(('.pdf')):
-                        # For PDFs, show a PDF icon
-                        file_html += '<div class="file-icon">📄</div>'
-                    else:
-                        # For other files show a generic file icon
-                        file_html += '<div class="file-icon">📁</div>'
-                    file_html += '</div>'
-                    
-                    # Add file name (shortened if needed)
-                    short_name = tip
-                    if len(short_name) > 20:
-                        name_parts = os.path.splitext(tip)
-                        short_name = name_parts[0][:17] + "..." + name_parts[1]
-                    file_html += f'<div class="file-name">{short_name}</div>'
-                    
-                    # Add download button
-                    download_link = file_download_link(file_path, tip)
-                    file_html += download_link
-                    
-                    # Add upload date
-                    file_html += f'<div style="font-size:0.8rem; text-align:center; margin-top:0.5rem;">Uploaded: {file_date}</div>'
-                    
-                    # Close file card
-                    file_html += '</div>'
-                    
-                    # Output the HTML
-                    st.markdown(file_html, unsafe_allow_html=True)
-                    
-                    # Add rename functionality in a separate column (only for admins)
-                    if st.session_state.is_admin:
-                        # We use an empty element with custom key to create separate UI elements for each file
-                        rename_key = f"rename_container_{tip}"
-                        if st.button("Rename", key=f"rename_tip_{tip}"):
-                            st.session_state[f"rename_tip_{tip}_active"] = True
-                        
-                        if st.session_state.get(f"rename_tip_{tip}_active", False):
-                            with st.form(key=f"rename_form_tip_{tip}"):
-                                new_name = st.text_input("New filename:", value=tip)
-                                col_a, col_b = st.columns(2)
-                                with col_a:
-                                    if st.form_submit_button("Save"):
-                                        if new_name != tip:
-                                            # Get file extension
-                                            _, file_extension = os.path.splitext(tip)
-                                            if not new_name.endswith(file_extension):
-                                                new_name += file_extension
-                                            
-                                            # Rename the file
-                                            new_file_path = tips_path / new_name
-                                            os.rename(file_path, new_file_path)
-                                            st.success(f"Renamed to {new_name}")
-                                            st.session_state[f"rename_tip_{tip}_active"] = False
-                                            st.rerun()
-                                with col_b:
-                                    if st.form_submit_button("Cancel"):
-                                        st.session_state[f"rename_tip_{tip}_active"] = False
-                                        st.rerun()
-                
-                # End file container
-                st.markdown('</div>', unsafe_allow_html=True)
-            else:
-                st.markdown("<p>No tips or guides found for this selection.</p>", unsafe_allow_html=True)
+        render_resource_gallery(resource_path, resource_type, empty_message)
         
         st.markdown('</div></div>', unsafe_allow_html=True)
 
 # Run the app
 if __name__ == "__main__":
-    main()
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
+    init_session()
+    start_services()
+    render_header()
+    render_sidebar()
+    with page_run("admin" if st.session_state.is_admin else "student"):
+        main()
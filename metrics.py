@@ -0,0 +1,154 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import METRICS_LOG
+
+logger = logging.getLogger("portal.metrics")
+if METRICS_LOG:
+    # One JSON object per line, ready for a log shipper
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Number of recent page runs kept for the admin diagnostics tab
+RECENT_RUNS = 50
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+_recent_runs = deque(maxlen=RECENT_RUNS)
+_local = threading.local()
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """Add to a counter, e.g. increment("bytes_sent_total", 512, route="files")"""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace["counters"][name] = trace["counters"].get(name, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    """Record one duration in a latency histogram"""
+    key = (name, _labels_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace["timings"][name] = trace["timings"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name, **labels):
+    """Measure how long a block takes, e.g. `with timed("settings_load_seconds"):`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def start_page_run():
+    """Start tracing a run of the Streamlit script on this thread"""
+    _local.trace = {"page": None, "timings": {}, "counters": {}, "start": time.perf_counter()}
+
+
+@contextmanager
+def page_run(page):
+    """Trace one run of the Streamlit script until the block ends.
+
+    Timings and counters recorded by this thread since start_page_run (or the
+    start of the block) are collected into a single structured log line and
+    kept for diagnostics.
+    """
+    if getattr(_local, "trace", None) is None:
+        start_page_run()
+    trace = _local.trace
+    trace["page"] = page
+    try:
+        yield trace
+    finally:
+        _local.trace = None
+        duration = time.perf_counter() - trace.pop("start")
+        observe("page_run_seconds", duration, page=page)
+        trace["seconds"] = round(duration, 6)
+        trace["timings"] = {name: round(seconds, 6) for name, seconds in trace["timings"].items()}
+        trace["time"] = time.time()
+        with _lock:
+            _recent_runs.append(trace)
+        logger.info(json.dumps(trace))
+
+
+def recent_runs():
+    """Return the traces of the latest page runs, newest first"""
+    with _lock:
+        return list(reversed(_recent_runs))
+
+
+def histogram_summaries():
+    """Return (name, labels, count, total seconds) for every histogram"""
+    with _lock:
+        return [(name, dict(labels), histogram[-2], histogram[-1])
+                for (name, labels), histogram in sorted(_histograms.items())]
+
+
+def counter_values():
+    """Return (name, labels, value) for every counter"""
+    with _lock:
+        return [(name, dict(labels), value) for (name, labels), value in sorted(_counters.items())]
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = ('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(value)) for key, value in _histograms.items())
+
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE portal_{name} counter")
+            typed.add(name)
+        lines.append(f"portal_{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), histogram in histograms:
+        if name not in typed:
+            lines.append(f"# TYPE portal_{name} histogram")
+            typed.add(name)
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            lines.append(f"portal_{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"portal_{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram[-2]}")
+        lines.append(f"portal_{name}_count{_format_labels(labels)} {histogram[-2]}")
+        lines.append(f"portal_{name}_sum{_format_labels(labels)} {histogram[-1]}")
+    return "\n".join(lines) + "\n"
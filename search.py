@@ -0,0 +1,51 @@
+import re
+
+from catalog import get_connection, resource_key
+from config import UPLOADS_DIR
+from metrics import timed
+
+# Relative weight of the name, course, resource_type and body columns in the ranking
+COLUMN_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+
+def set_resource_texts(entries):
+    """Store the extracted text of resources in the search index.
+
+    Each entry is a (file path, text) tuple; all are written in one transaction.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE search_index SET body = ? WHERE rowid = "
+            "(SELECT id FROM search_documents WHERE course_dir = ? AND resource_type = ? AND name = ?)",
+            [(text, *resource_key(file_path)) for file_path, text in entries if text],
+        )
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_resources(query, limit=50):
+    """Return the catalogued resources best matching a query, best first.
+
+    Each row has the resource columns plus `file_path`.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    with timed("search_seconds"):
+        rows = get_connection().execute(
+            "SELECT r.* FROM search_index "
+            "JOIN search_documents d ON d.id = search_index.rowid "
+            "JOIN resources r ON r.course_dir = d.course_dir AND r.resource_type = d.resource_type AND r.name = d.name "
+            "WHERE search_index MATCH ? "
+            # Courses deleted but not yet reclaimed by the garbage collector
+            "AND NOT EXISTS (SELECT 1 FROM tombstones t WHERE NOT t.catalog_done AND (r.course_dir = t.prefix "
+            "OR substr(r.course_dir, 1, length(t.prefix) + 1) = t.prefix || '/')) "
+            f"ORDER BY bm25(search_index, {', '.join(map(str, COLUMN_WEIGHTS))}) LIMIT ?",
+            (match, limit),
+        ).fetchall()
+    return [dict(row, file_path=UPLOADS_DIR / row["course_dir"] / row["resource_type"] / row["name"]) for row in rows]
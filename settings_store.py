@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from hierarchy import Hierarchy
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+# Number of journal entries after which they are folded into the snapshot
+COMPACT_AFTER = 100
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it over the target"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SettingsStore:
+    """Process-wide university/semester/course hierarchy shared by every session.
+
+    Settings are persisted as a JSON snapshot plus an append-only journal of
+    changes. Each admin edit appends one line to the journal under a file lock,
+    and the journal is folded back into the snapshot every COMPACT_AFTER
+    entries. Readers only re-parse the snapshot when it is replaced and
+    otherwise replay the journal lines they have not seen yet.
+    """
+
+    def __init__(self, settings_path):
+        self.settings_path = Path(settings_path)
+        self.journal_path = self.settings_path.with_suffix(".journal")
+        self.lock_path = self.settings_path.with_suffix(".lock")
+        self.lock = threading.RLock()
+        self.snapshot_stat = None
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self.settings = None
+
+    @contextmanager
+    def file_lock(self):
+        """Serialize writers across threads and processes"""
+        with self.lock:
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def current_stat(self):
+        stat = os.stat(self.settings_path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def is_current(self):
+        return (self.settings is not None
+                and self.current_stat() == self.snapshot_stat
+                and self.journal_size() == self.journal_offset)
+
+    def refresh(self):
+        """Bring the in-memory tree up to date with the snapshot and journal"""
+        snapshot_stat = self.current_stat()
+        if snapshot_stat != self.snapshot_stat or self.journal_size() < self.journal_offset:
+            with open(self.settings_path, 'r') as f:
+                self.settings = Hierarchy.from_dict(json.load(f))
+            self.snapshot_stat = snapshot_stat
+            self.journal_offset = 0
+            self.journal_entries = 0
+        self.replay_journal()
+
+    def replay_journal(self):
+        """Apply journal entries appended since the last refresh"""
+        if self.journal_size() == self.journal_offset:
+            return
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self.journal_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A writer is still appending this entry
+                    break
+                self.journal_offset += len(line)
+                entry = json.loads(line)
+                self.journal_entries += 1
+                # Entries already folded into the snapshot are skipped
+                if entry["version"] > self.settings.version:
+                    self.settings.apply_change(entry)
+                    self.settings.version = entry["version"]
+
+    def get(self):
+        """Return the current settings, reloading them if the files changed"""
+        if self.is_current():
+            return self.settings
+        with self.lock:
+            self.refresh()
+            return self.settings
+
+    def update(self, change):
+        """Apply a change and append it to the journal"""
+        with self.file_lock():
+            self.refresh()
+            entry = dict(change, version=self.settings.version + 1)
+            self.settings.apply_change(change)
+            self.settings.version = entry["version"]
+
+            with open(self.journal_path, 'ab') as f:
+                f.write(json.dumps(entry).encode() + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self.journal_offset = f.tell()
+            self.journal_entries += 1
+
+            if self.journal_entries >= COMPACT_AFTER:
+                self.compact()
+        return self.settings
+
+    def compact(self):
+        """Fold the journal into a new snapshot (caller holds the file lock)"""
+        write_json_atomic(self.settings_path, self.settings.to_dict())
+        # The snapshot already contains every entry, so the journal can go
+        with open(self.journal_path, 'wb'):
+            pass
+        self.snapshot_stat = self.current_stat()
+        self.journal_offset = 0
+        self.journal_entries = 0
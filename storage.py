@@ -0,0 +1,266 @@
+import functools
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+from config import INGEST_CHUNK_SIZE, S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX, STORAGE_BACKEND, UPLOADS_DIR
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed for the S3 backend
+    boto3 = None
+
+# Metadata of one stored resource; `key` is its path below the uploads root
+StoredObject = namedtuple("StoredObject", ["key", "size", "mtime_ns"])
+
+
+def is_missing(error):
+    """Check whether an S3 ClientError means the object does not exist"""
+    return error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound")
+
+
+def storage_key(file_path):
+    """Return the storage key of a file below the uploads directory"""
+    return Path(file_path).relative_to(UPLOADS_DIR).as_posix()
+
+
+class StorageBackend:
+    """Where uploaded resources are kept.
+
+    Objects are addressed by '/'-separated keys such as
+    "Uni/Semester/Course/exams/final.pdf". Readers that need a real file
+    (thumbnails, text extraction, the file server) ask for `local_path`.
+    """
+
+    # Whether other portal replicas write to the same objects
+    shared = False
+
+    def list(self, prefix):
+        """Yield a StoredObject for every object whose key starts with `prefix/`"""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Return the StoredObject for a key, raising FileNotFoundError if it is missing"""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Return a binary stream of an object's content"""
+        raise NotImplementedError
+
+    def put(self, key, stream):
+        """Store the content of a binary stream under a key, replacing any existing object"""
+        raise NotImplementedError
+
+    def put_file(self, key, source_path, exclusive=False):
+        """Store a local file under a key; with `exclusive`, raise FileExistsError if the key is taken"""
+        if exclusive and self.exists(key):
+            raise FileExistsError(key)
+        with open(source_path, "rb") as f:
+            self.put(key, f)
+
+    def rename(self, old_key, new_key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Delete an object; deleting a missing object is not an error"""
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """Delete every object below a prefix (e.g. a whole course)"""
+        raise NotImplementedError
+
+    def move_prefix(self, prefix, new_prefix):
+        """Move every object below a prefix at once; return False if the backend cannot do that cheaply"""
+        return False
+
+    def local_path(self, key):
+        """Return a local file holding the object's content"""
+        raise NotImplementedError
+
+    def drop_local_copy(self, key):
+        """Forget the local copy of an object that was changed or deleted elsewhere"""
+
+    def exists(self, key):
+        try:
+            self.stat(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class LocalStorage(StorageBackend):
+    """Resources stored as plain files under a directory"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key):
+        return self.root / key
+
+    def list(self, prefix):
+        for dir_path, _, file_names in os.walk(self.path(prefix)):
+            for file_name in file_names:
+                path = Path(dir_path) / file_name
+                stat = path.stat()
+                yield StoredObject(path.relative_to(self.root).as_posix(), stat.st_size, stat.st_mtime_ns)
+
+    def stat(self, key):
+        stat = os.stat(self.path(key))
+        return StoredObject(key, stat.st_size, stat.st_mtime_ns)
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def put(self, key, stream):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary name first so readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+            try:
+                shutil.copyfileobj(stream, tmp, INGEST_CHUNK_SIZE)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+
+    def put_file(self, key, source_path, exclusive=False):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not exclusive:
+            path.unlink(missing_ok=True)
+        try:
+            # Share the bytes of the source (e.g. a blob) via a hard link
+            os.link(source_path, path)
+        except FileExistsError:
+            raise
+        except OSError:
+            # Hard links are not available across filesystems or on some mounts
+            with open(source_path, "rb") as src, open(path, "xb") as dst:
+                shutil.copyfileobj(src, dst, INGEST_CHUNK_SIZE)
+
+    def rename(self, old_key, new_key):
+        new_path = self.path(new_key)
+        new_path.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(self.path(old_key), new_path)
+
+    def delete(self, key):
+        self.path(key).unlink(missing_ok=True)
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def move_prefix(self, prefix, new_prefix):
+        new_path = self.path(new_prefix)
+        new_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(self.path(prefix), new_path)
+        except FileNotFoundError:
+            pass  # Nothing was stored below the prefix
+        return True
+
+    def local_path(self, key):
+        return self.path(key)
+
+
+class S3Storage(StorageBackend):
+    """Resources stored in an S3-compatible bucket (AWS S3, MinIO, ...).
+
+    The bucket is shared by every portal replica. Each replica keeps a local
+    copy of the objects it writes or reads under the uploads directory, which
+    is what thumbnails, text extraction and the file server work from.
+    """
+
+    shared = True
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, cache=None):
+        if boto3 is None:
+            raise RuntimeError("The S3 storage backend requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        # Credentials and region come from the usual AWS_* environment variables
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.cache = cache or LocalStorage(UPLOADS_DIR)
+
+    def object_key(self, key):
+        return self.prefix + key
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.object_key(prefix.rstrip("/") + "/")):
+            for obj in page.get("Contents", []):
+                yield StoredObject(obj["Key"][len(self.prefix):], obj["Size"],
+                                   int(obj["LastModified"].timestamp() * 1e9))
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+        return StoredObject(key, head["ContentLength"], int(head["LastModified"].timestamp() * 1e9))
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+
+    def put(self, key, stream):
+        # upload_fileobj switches to a multipart upload for large streams
+        self.client.upload_fileobj(stream, self.bucket, self.object_key(key))
+        self.cache.delete(key)
+
+    def put_file(self, key, source_path, exclusive=False):
+        if exclusive and self.exists(key):
+            raise FileExistsError(key)
+        self.client.upload_file(str(source_path), self.bucket, self.object_key(key))
+        self.cache.put_file(key, source_path)
+
+    def rename(self, old_key, new_key):
+        self.client.copy({"Bucket": self.bucket, "Key": self.object_key(old_key)}, self.bucket, self.object_key(new_key))
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(old_key))
+        if self.cache.exists(old_key):
+            self.cache.rename(old_key, new_key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        self.cache.delete(key)
+
+    def delete_prefix(self, prefix):
+        keys = [obj.key for obj in self.list(prefix)]
+        # DeleteObjects accepts at most 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": self.object_key(key)} for key in keys[start:start + 1000]], "Quiet": True,
+            })
+        self.cache.delete_prefix(prefix)
+
+    def local_path(self, key):
+        path = self.cache.path(key)
+        if not path.is_file():
+            # Written by another replica: fetch it once
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+                try:
+                    self.client.download_fileobj(self.bucket, self.object_key(key), tmp)
+                except BaseException as e:
+                    tmp.close()
+                    os.remove(tmp.name)
+                    if isinstance(e, ClientError) and is_missing(e):
+                        raise FileNotFoundError(key) from e
+                    raise
+            os.replace(tmp.name, path)
+        return path
+
+    def drop_local_copy(self, key):
+        self.cache.delete(key)
+
+
+@functools.cache
+def get_storage():
+    """Return the storage backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+    return LocalStorage(UPLOADS_DIR)
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+
+from PIL import Image, ImageOps, features
+
+from config import THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_DIR, THUMBNAIL_MAX_SIZE
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDFs keep their icon when pypdfium2 is not installed
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+# Errors meaning a file cannot be turned into a preview
+PREVIEW_ERRORS = (OSError, Image.DecompressionBombError, ValueError) + ((pdfium.PdfiumError,) if pdfium else ())
+
+# Prefer WebP for previews and fall back to JPEG when Pillow was built without it
+if features.check("webp"):
+    THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = "WEBP", ".webp"
+else:
+    THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = "JPEG", ".jpg"
+
+# Eviction trims the cache to this share of its budget, so it does not run again on the next write
+EVICTION_TARGET = 0.9
+
+_eviction_lock = threading.Lock()
+# Estimated bytes in the thumbnail cache; None until the directory was first scanned
+_cache_size = None
+# PDFium is not thread-safe
+_pdfium_lock = threading.Lock()
+
+
+def is_image(file_name):
+    """Check whether a file can be previewed as an image"""
+    return str(file_name).lower().endswith(IMAGE_EXTENSIONS)
+
+
+def is_pdf(file_name):
+    return str(file_name).lower().endswith('.pdf')
+
+
+def can_preview(file_name):
+    """Check whether a preview can be generated for a file"""
+    return is_image(file_name) or (is_pdf(file_name) and pdfium is not None)
+
+
+def open_preview_image(file_path):
+    """Open an image, or render the first page of a PDF, as a PIL image"""
+    if not is_pdf(file_path):
+        return Image.open(file_path)
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(str(file_path))
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            # Render straight at preview size instead of rasterizing the full page
+            scale = min(THUMBNAIL_MAX_SIZE[0] / width, THUMBNAIL_MAX_SIZE[1] / height)
+            return page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+
+
+def thumbnail_key(file_path, mtime_ns=None, size=None):
+    """Derive the cache key of a file's thumbnail from its path, mtime and size.
+
+    The mtime and size are read from the file unless given, e.g. from the
+    catalog entry of a file that no longer exists.
+    """
+    if mtime_ns is None:
+        stat = os.stat(file_path)
+        mtime_ns, size = stat.st_mtime_ns, stat.st_size
+    identity = f"{Path(file_path).resolve()}:{mtime_ns}:{size}"
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+def thumbnail_path_for_key(key):
+    """Return the cache location of the thumbnail with the given key"""
+    return THUMBNAIL_DIR / f"{key}{THUMBNAIL_EXTENSION}"
+
+
+def generate_thumbnail(file_path):
+    """Create the thumbnail for an image or PDF and return its cache path.
+
+    Returns None when the file cannot be decoded.
+    """
+    thumbnail_path = thumbnail_path_for_key(thumbnail_key(file_path))
+    if thumbnail_path.exists():
+        return thumbnail_path
+
+    try:
+        with open_preview_image(file_path) as img:
+            # Phone photos are often stored sideways with an EXIF orientation flag
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(THUMBNAIL_MAX_SIZE)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            if THUMBNAIL_FORMAT == "JPEG" and img.mode == "RGBA":
+                img = img.convert("RGB")
+
+            THUMBNAIL_DIR.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary name first so readers never see a partial file
+            tmp_path = thumbnail_path.with_suffix(f".{threading.get_ident()}.tmp")
+            img.save(tmp_path, THUMBNAIL_FORMAT, quality=75)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, thumbnail_path)
+    except PREVIEW_ERRORS as e:
+        logger.warning("Could not create thumbnail for %s: %s", file_path, e)
+        return None
+
+    record_thumbnail_written(size)
+    return thumbnail_path
+
+
+def get_thumbnail(file_path):
+    """Return the cached thumbnail for a file, generating it if necessary"""
+    if not can_preview(file_path):
+        return None
+    thumbnail_path = thumbnail_path_for_key(thumbnail_key(file_path))
+    if thumbnail_path.exists():
+        # Refresh the modification time so eviction treats it as recently used
+        try:
+            os.utime(thumbnail_path)
+        except OSError:
+            pass
+        return thumbnail_path
+    return generate_thumbnail(file_path)
+
+
+def render_preview(file_path):
+    """Generate a preview ahead of time and return the resource's new thumbnail status"""
+    return "ready" if generate_thumbnail(file_path) else "failed"
+
+
+def move_thumbnail(old_key, new_path, mtime_ns=None, size=None):
+    """Keep a cached preview after its file was renamed (the key includes the path).
+
+    Pass the mtime and size from the catalog when the file may have no local copy.
+    """
+    try:
+        os.replace(thumbnail_path_for_key(old_key), thumbnail_path_for_key(thumbnail_key(new_path, mtime_ns, size)))
+    except FileNotFoundError:
+        pass
+
+
+def remove_thumbnail(file_path, mtime_ns=None, size=None):
+    """Drop the cached preview of a file that is about to be deleted.
+
+    Pass the mtime and size from the catalog when the file may have no local copy.
+    """
+    try:
+        os.remove(thumbnail_path_for_key(thumbnail_key(file_path, mtime_ns, size)))
+    except FileNotFoundError:
+        pass
+
+
+def record_thumbnail_written(size, max_bytes=THUMBNAIL_CACHE_MAX_BYTES):
+    """Count a new thumbnail towards the cache size, evicting once the budget is exceeded.
+
+    The directory is only scanned the first time and when the running total
+    goes over budget, not after every thumbnail.
+    """
+    global _cache_size
+    with _eviction_lock:
+        if _cache_size is not None:
+            _cache_size += size
+            if _cache_size <= max_bytes:
+                return
+    evict_thumbnails(max_bytes)
+
+
+def evict_thumbnails(max_bytes=THUMBNAIL_CACHE_MAX_BYTES):
+    """Delete the least recently used thumbnails once the cache exceeds its budget.
+
+    Also corrects the running size total, which other processes and deleted
+    resources make drift.
+    """
+    global _cache_size
+    with _eviction_lock:
+        entries = []
+        total_size = 0
+        for entry in os.scandir(THUMBNAIL_DIR):
+            if entry.is_file() and entry.name.endswith(THUMBNAIL_EXTENSION):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        if total_size > max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+                if total_size <= max_bytes * EVICTION_TARGET:
+                    break
+        _cache_size = total_size
@@ -0,0 +1,79 @@
+import hashlib
+import io
+import os
+
+from PIL import Image, ImageOps, features
+
+from catalog import replace_resource, set_thumbnail_status
+from config import IMAGE_MAX_DIMENSION, IMAGE_OPTIMIZE, IMAGE_QUALITY
+from ingest import unique_destination
+from metrics import increment
+from storage import get_storage, storage_key
+from thumbnails import generate_thumbnail, remove_thumbnail
+
+# Uploads worth re-encoding; GIFs are left alone since they are often animated
+TRANSCODE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def can_transcode(file_name):
+    """Check whether an upload is a photo that the optimization stage handles"""
+    return IMAGE_OPTIMIZE != "off" and str(file_name).lower().endswith(TRANSCODE_EXTENSIONS)
+
+
+def transcode_image(file_path):
+    """Scale down and re-encode a photo without its metadata (run in a worker process).
+
+    Returns (encoded bytes, file extension), or None when the result would not
+    be smaller than the upload.
+    """
+    with Image.open(file_path) as img:
+        if getattr(img, "is_animated", False):
+            return None
+        # Bake the EXIF orientation into the pixels, since the EXIF block is dropped
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+        has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+
+        # Nothing but the pixels is passed on, so EXIF, GPS and comments are not written
+        buffer = io.BytesIO()
+        if IMAGE_OPTIMIZE == "webp" and features.check("webp"):
+            img.convert("RGBA" if has_alpha else "RGB").save(buffer, "WEBP", quality=IMAGE_QUALITY, method=4)
+            extension = ".webp"
+        elif has_alpha:
+            # JPEG has no transparency, so such images stay PNGs
+            img.save(buffer, "PNG", optimize=True)
+            extension = ".png"
+        else:
+            img.convert("RGB").save(buffer, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+            extension = ".jpg"
+
+    if buffer.tell() >= os.path.getsize(file_path):
+        return None
+    return buffer.getvalue(), extension
+
+
+def store_transcoded_image(file_path, result):
+    """Replace an upload with its re-encoded version and refresh its catalog entry and preview"""
+    if result is None:
+        increment("images_transcoded_total", outcome="kept")
+        return
+    data, extension = result
+    storage = get_storage()
+    size_before = os.path.getsize(file_path)
+
+    remove_thumbnail(file_path)
+    stem, old_extension = os.path.splitext(file_path.name)
+    old_extension = old_extension.lower().replace(".jpeg", ".jpg")
+    # A change of format changes the extension, so the file gets a new name
+    new_path = file_path if old_extension == extension else unique_destination(file_path.parent, stem + extension)
+    storage.put(storage_key(new_path), io.BytesIO(data))
+    if new_path != file_path:
+        storage.delete(storage_key(file_path))
+    # Shared storage drops the local copy of a replaced object; the catalog and preview need one
+    storage.local_path(storage_key(new_path))
+
+    # The upload itself stays in the blob store, which drops it with IMAGE_KEEP_ORIGINAL=0
+    replace_resource(file_path, new_path, hashlib.sha256(data).hexdigest())
+    set_thumbnail_status(new_path, "ready" if generate_thumbnail(new_path) else "failed")
+    increment("images_transcoded_total", outcome="replaced")
+    increment("image_bytes_saved_total", size_before - len(data))
@@ -1,9 +1,24 @@
-import json
+import logging
 import os
 from pathlib import Path
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 
-# Default settings to use if settings.json doesn't exist
+from config import SETTINGS_PATH, RESOURCE_SERVER_HOST, RESOURCE_SERVER_PORT, RESOURCE_SERVER_URL, SELECTOR_LIMIT
+from hierarchy import Course, Hierarchy, Semester, University
+from metrics import timed
+from settings_store import SettingsStore, write_json_atomic
+from jobs import JobQueue
+from catalog import get_stats
+from cleanup import GarbageCollector
+from analytics import AnalyticsWriter
+from storage import storage_key
+from fileserver import blob_url_path, bundle_url_path, resource_path_to_url_path, start_file_server, thumbnail_url_path
+
+logger = logging.getLogger(__name__)
+
+# Default settings to use if settings.json doesn't exist (migrated to the
+# ID-based hierarchy layout when first loaded)
 DEFAULT_SETTINGS = {
     "universities": ["Example University"],
     "semesters": {"Example University": ["Semester 1", "Semester 2"]},
@@ -15,42 +30,207 @@ def create_directory_if_not_exists(directory_path):
     if not os.path.exists(directory_path):
         os.makedirs(directory_path)
 
+def rerun_fragment():
+    """Rerun only the current fragment, or the whole app when it ran as part of a full run"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # Fragment-scoped reruns are only allowed while the fragment reruns on its own
+        st.rerun()
+
+@st.cache_resource
+def get_settings_store():
+    """Return the settings store shared by all sessions of this process"""
+    return SettingsStore(SETTINGS_PATH)
+
 def load_settings():
-    """Load settings from the settings.json file"""
-    settings_path = Path("data/settings.json")
+    """Load the university/semester/course hierarchy from the settings.json file"""
+    settings_path = SETTINGS_PATH
     
     if not settings_path.exists():
         # Create the default settings file if it doesn't exist
-        with open(settings_path, 'w') as f:
-            json.dump(DEFAULT_SETTINGS, f, indent=4)
-        return DEFAULT_SETTINGS
+        write_json_atomic(settings_path, DEFAULT_SETTINGS)
     
     try:
-        with open(settings_path, 'r') as f:
-            return json.load(f)
+        with timed("settings_load_seconds"):
+            return get_settings_store().get()
     except Exception as e:
         st.error(f"Error loading settings: {e}")
-        return DEFAULT_SETTINGS
+        return Hierarchy.from_dict(DEFAULT_SETTINGS)
 
-def save_settings(settings):
-    """Save settings to the settings.json file"""
-    settings_path = Path("data/settings.json")
-    
+def update_settings(change):
+    """Record a single change (e.g. {"op": "add_course", ...}) in the settings journal"""
     try:
-        with open(settings_path, 'w') as f:
-            json.dump(settings, f, indent=4)
-        st.session_state.settings = settings
+        st.session_state.settings = get_settings_store().update(change)
         return True
     except Exception as e:
         st.error(f"Error saving settings: {e}")
         return False
 
-def get_file_path(university, semester, course):
-    """Generate a file path for a given university, semester, and course"""
+def format_name(node):
+    """Show a university, semester or course by its name in selectboxes"""
+    return node.name
+
+def format_count(count, noun):
+    """Show a count with its noun, e.g. "1 file" or "3 files" """
+    return f"{count} {noun}" if count == 1 else f"{count} {noun}s"
+
+def format_size(size):
+    """Show a number of bytes in KB, MB or GB"""
+    for unit in ("KB", "MB"):
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GB"
+
+def node_stats(nodes):
+    """Return the statistics of university, semester or course nodes, keyed by node ID (see catalog.get_stats)"""
+    keys = {node.id: storage_key(get_node_path(node)) for node in nodes}
+    stats = get_stats(keys.values())
+    return {node_id: stats.get(key, {}) for node_id, key in keys.items()}
+
+def filter_nodes(hierarchy, parent, key, label_visibility="visible"):
+    """Return the children of a node (universities when `parent` is None) to offer.
+
+    Up to SELECTOR_LIMIT children are returned as they are. Longer lists get a
+    type-ahead filter, and only the first SELECTOR_LIMIT matches are returned,
+    so the page stays small however large the catalog grows.
+    """
+    index = hierarchy.name_index(parent)
+    if len(index) <= SELECTOR_LIMIT:
+        return index.nodes
+
+    kind = "universities" if parent is None else "semesters" if isinstance(parent, University) else "courses"
+    query = st.text_input(f"Search {kind}", key=f"{key}_filter", label_visibility=label_visibility,
+                          placeholder=f"Type to search {len(index)} {kind}...")
+    nodes, more = index.search(query, SELECTOR_LIMIT)
+    if more:
+        st.caption(f"Showing the first {SELECTOR_LIMIT} matches; keep typing to narrow them down.")
+    elif not nodes:
+        st.caption(f"No {kind} match “{query}”.")
+    return nodes
+
+def select_node(label, hierarchy, parent, key, label_visibility="visible"):
+    """Selectbox over the children of a node, with a type-ahead filter for long lists.
+
+    Each option is labelled with the number of files below it.
+    """
+    nodes = filter_nodes(hierarchy, parent, key, label_visibility)
+    current = st.session_state.get(key)
+    if current in hierarchy.name_index(parent) and all(node.id != current.id for node in nodes):
+        # Keep the current choice selectable while the filter no longer matches it
+        nodes = [hierarchy.get(current.id), *nodes]
+    stats = node_stats(nodes)
+
+    def format_with_count(node):
+        # Courses that were never browsed or uploaded to are not catalogued yet
+        total = stats.get(node.id, {}).get("*")
+        return format_name(node) if total is None else f"{format_name(node)} · {format_count(total[0], 'file')}"
+
+    return st.selectbox(label, nodes, format_func=format_with_count, key=key, label_visibility=label_visibility)
+
+def get_file_path(university, semester=None, course=None):
+    """Generate a file path for a given university, semester, and course (or just the first of them)"""
     # Replace any characters that might cause issues in file paths
-    safe_uni = university.replace(" ", "_").replace("/", "-")
-    safe_semester = semester.replace(" ", "_").replace("/", "-")
-    safe_course = course.replace(" ", "_").replace("/", "-")
+    names = [name.replace(" ", "_").replace("/", "-") for name in (university, semester, course) if name is not None]
     
     # Construct and return the path
-    return Path(f"data/uploads/{safe_uni}/{safe_semester}/{safe_course}")
+    return Path("data/uploads", *names)
+
+def get_course_path(course):
+    """Return the resource directory of a course node"""
+    return get_file_path(course.university.name, course.semester.name, course.name)
+
+def find_clashing_sibling(hierarchy, parent, name):
+    """Return the node a new child `name` of `parent` (None for a university) would clash with, if any.
+
+    Names that only differ in characters get_file_path replaces, such as
+    "Uni A" and "Uni_A", would share an upload directory, so they clash too.
+    """
+    names = [name]
+    node = parent
+    while node is not None:
+        names.insert(0, node.name)
+        node = node.university if isinstance(node, Semester) else None
+    path = get_file_path(*names)
+    return next((child for child in hierarchy.children(parent).values()
+                 if child.name == name or get_node_path(child) == path), None)
+
+def get_node_path(node):
+    """Return the upload directory of a university, semester or course node"""
+    if isinstance(node, University):
+        return get_file_path(node.name)
+    if isinstance(node, Semester):
+        return get_file_path(node.university.name, node.name)
+    return get_course_path(node)
+
+@st.cache_resource
+def start_resource_server():
+    """Start the companion file server once per process"""
+    try:
+        return start_file_server(RESOURCE_SERVER_HOST, RESOURCE_SERVER_PORT)
+    except OSError as e:
+        # Most likely another portal process is already serving the uploads
+        logger.warning("Resource file server not started: %s", e)
+        return None
+
+@st.cache_resource
+def start_job_queue():
+    """Start the background job workers once per process"""
+    store = get_settings_store()
+    # Courses nobody has opened yet are indexed in the background, so search and statistics cover them
+    return JobQueue().start(lambda: [get_course_path(node) for node in store.get().nodes.values()
+                                     if isinstance(node, Course)])
+
+@st.cache_resource
+def start_garbage_collector():
+    """Start the background collector of deleted courses once per process"""
+    store = get_settings_store()
+    # Uses the store directly: a settings file that fails to load must not make every course look orphaned
+    return GarbageCollector(lambda: {storage_key(get_node_path(node)) for node in store.get().nodes.values()}).start()
+
+@st.cache_resource
+def start_analytics():
+    """Start writing recorded downloads and views to the catalog once per process"""
+    return AnalyticsWriter().start()
+
+def is_https_page():
+    """Check whether the current session loaded the portal over HTTPS (possibly behind a proxy)"""
+    headers = st.context.headers
+    forwarded_proto = headers.get("X-Forwarded-Proto", "").split(",")[0].strip().lower()
+    return forwarded_proto == "https" or headers.get("Origin", "").lower().startswith("https://")
+
+def get_resource_server_base_url():
+    """Return the base URL of the resource file server as seen by the current session"""
+    if RESOURCE_SERVER_URL:
+        return RESOURCE_SERVER_URL
+    if is_https_page():
+        # //host:port would resolve to https:// against the plain-HTTP file server, so every link would be dead
+        st.error("Downloads are unavailable: this portal is served over HTTPS, so RESOURCE_SERVER_URL must be "
+                 "set to the HTTPS address of the file server (e.g. a path proxied to it on this host).")
+        st.stop()
+    # Reuse the host the student connected to, pointed at the file server port
+    host = st.context.headers.get("Host", "localhost").rsplit(":", 1)[0]
+    return f"//{host}:{RESOURCE_SERVER_PORT}"
+
+def get_resource_server_url(url_path):
+    """Build an absolute URL on the resource file server for the given path"""
+    return get_resource_server_base_url() + url_path
+
+def get_resource_url(file_path, sha256=None):
+    """Build the URL under which the browser can fetch an uploaded file.
+
+    Given the file's content hash, the URL is immutable and can be cached by
+    browsers and proxies for good.
+    """
+    if sha256:
+        return get_resource_server_url(blob_url_path(sha256, Path(file_path).name))
+    return get_resource_server_url(resource_path_to_url_path(file_path))
+
+def get_thumbnail_url(file_path, mtime_ns, size):
+    """Build the URL under which the browser can fetch an image's preview"""
+    return get_resource_server_url(thumbnail_url_path(file_path, f"{mtime_ns:x}-{size:x}"))
+
+def get_bundle_url(course_path, resource_type):
+    """Build the URL of the ZIP holding a course's resources of one type ("all" for every type)"""
+    return get_resource_server_url(bundle_url_path(course_path, resource_type))